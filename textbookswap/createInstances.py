@@ -36,7 +36,7 @@ def createUserInstances(number=10):
         firstname = randomText(random.randrange(3, 15, 1))
         lastname = randomText(random.randrange(3, 15, 1))
         email = randomString(random.randrange(5, 20, 1))+"@macmail.com"
-        while (len(User.objects.filter(username=username)) > 0 or len(User.objects.filter(email=email)) > 0):
+        while User.objects.filter(username=username).exists() or User.objects.filter(email=email).exists():
             username = randomString(random.randrange(5, 20, 1))
             email = randomString(random.randrange(5, 20, 1))+"@macmail.com"
         password = "Test12345"
@@ -45,8 +45,10 @@ def createUserInstances(number=10):
 
 
 def createPostInstances(number=10):
+    # for more than a few hundred rows use the generatedata management command
+    users = list(User.objects.all())
     for i in range(number):
-        user = random.choice(User.objects.all())
+        user = random.choice(users)
         title = randomText(random.randrange(5, 20, 1))
         ISBN = randomNumbers(13)
         author = randomText(random.randrange(5, 20, 1))
@@ -198,8 +200,9 @@ def createRealPostInstances():
         "The Ravings of Garvus[3rd Edition]": " The assorted notes and thoughts of an ancient and powerful wizard from an era long past. His mind was obliterated upon making contact"
     }
 
+    users = list(User.objects.all())
     for title in bookList:
-        user = random.choice(User.objects.all())
+        user = random.choice(users)
         ISBN = randomNumbers(13)
         author = random.choice(authorList)
         edition = random.randrange(1, 15, 1)
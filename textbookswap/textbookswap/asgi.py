@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'textbookswap.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# the event stream for the messaging panel is served straight from the event loop, see tradeboard/events.py
+from tradeboard.events import route  # noqa: E402
+
+application = route(django_application)
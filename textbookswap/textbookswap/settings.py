@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 import getpass
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tradeboard.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +60,8 @@ ROOT_URLCONF = 'textbookswap.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the django backend, timing every template for tradeboard/instrumentation.py
+        'BACKEND': 'tradeboard.instrumentation.Templates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,6 +93,83 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# holds the rendered post cards and each user's bookmarked post ids. Every process gets its own local-memory
+# cache; switch to 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION directory to share
+# the cards between processes.
+# The version stamps (see tradeboard/stamps.py) must be shared by every process serving the site, since a change
+# only bumps them in the process that made it. A directory on the one machine running them all does that, with
+# several machines use memcached or redis instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'textbookswap',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # ids of the results of recent searches (see tradeboard/search.py), the least recently used go first
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'textbookswap-search',
+        'TIMEOUT': 5 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # a stamp that expires or is culled is drawn again, which only costs a cache miss
+    'stamps': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'textbookswap-stamps'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+
+# Search ranking
+# weight of every signal the Recommended search ordering adds up (see tradeboard/ranking.py), 0 leaves one out.
+# Try other weights with `manage.py benchmark --ranking '{"recency": 2}'` before changing them here.
+
+SEARCH_RANKING = {
+    'relevance': 1.0,
+    'recency': 1.0,
+    'price': 0.3,
+    'popularity': 0.5,
+}
+# days after which the recency of a post counts half
+SEARCH_RECENCY_HALF_LIFE_DAYS = 14
+
+
+# Instrumentation
+# see tradeboard/instrumentation.py. The figures of every request are served at /metrics/ to these addresses
+# (and to staff), and added to each response as a Server-Timing header when SERVER_TIMING is on.
+
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+SERVER_TIMING = DEBUG
+SLOW_REQUEST_SECONDS = 1
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'tradeboard': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'INFO',
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -130,6 +210,8 @@ STATIC_URL = '/static/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# processes making the smaller copies of uploaded images (tradeboard/thumbnails.py), 0 makes them in the request
+THUMBNAIL_WORKERS = 2
 
 LOGIN_REDIRECT_URL = 'tradeboard-home'
 LOGIN_URL = 'login'
@@ -12,6 +12,9 @@ from django.views.generic import TemplateView
 urlpatterns = [
     # path('',auth_views.LoginView.as_view(template_name='users/login.html'), name='login'),
     path('', home, name='tradeboard-home'),
+    path('actions/<slug:name>/', tradeboard_view.action, name='tradeboard-action'),
+    path('events/poll/', tradeboard_view.pollEvents, name='events-poll'),
+    path('metrics/', tradeboard_view.metrics, name='metrics'),
     path('contact-info/<int:pk>/',
          ContactDetailView.as_view(), name='contact_detail'),
     path('admin/', admin.site.urls),
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import Post, Bookmark, MessageThread, Message
+from .models import Post, Bookmark, MessageThread, Message, Inbox, CurrentOffer
 
 admin.site.register(Post)
 admin.site.register(Bookmark)
 admin.site.register(MessageThread)
 admin.site.register(Message)
+admin.site.register(Inbox)
+admin.site.register(CurrentOffer)
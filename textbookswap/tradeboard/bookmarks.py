@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Bookmark, Post
+from .stamps import bookmarks_key, bump, versions
+
+# The ids of the posts a user bookmarked are kept in the cache as a set, so the post cards can tell whether
+# to draw a filled bookmark with a set lookup instead of a subquery per post (see cards.render_cards).
+# The set is kept under the user's bookmarks stamp (see stamps.py), which toggle() bumps, so every process reads
+# it again after a change and none goes on drawing the bookmarks the user had before.
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def cache_key(user_id):
+    stamp = bookmarks_key(user_id)
+    return f'bookmarked-post-ids:{user_id}:{versions([stamp])[stamp]}'
+
+
+def bookmarked_ids(user):
+    """set of the ids of every post the user has bookmarked"""
+    key = cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = set(Bookmark.objects.filter(
+            user=user).values_list('post_id', flat=True))
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+# removes the bookmark if there is one, otherwise adds it, and counts it on the post, in a single statement.
+# The final SELECT only gives back a row when the bookmark was added.
+TOGGLE_SQL = f"""
+    WITH removed AS (
+        DELETE FROM {Bookmark._meta.db_table} WHERE user_id = %(user)s AND post_id = %(post)s RETURNING id
+    ), added AS (
+        INSERT INTO {Bookmark._meta.db_table} (user_id, post_id, date_bookmarked)
+        SELECT %(user)s, %(post)s, now() WHERE NOT EXISTS (SELECT 1 FROM removed)
+        ON CONFLICT (user_id, post_id) DO NOTHING
+        RETURNING id
+    ), counted AS (
+        UPDATE {Post._meta.db_table}
+        SET bookmark_count = GREATEST(bookmark_count + (SELECT count(*) FROM added) - (SELECT count(*) FROM removed), 0)
+        WHERE id = %(post)s
+    )
+    SELECT id FROM added
+"""
+
+
+def toggle(user, post_id):
+    """bookmarks the post if the user hadn't bookmarked it yet and removes the bookmark otherwise, returns whether it is now bookmarked"""
+    with connection.cursor() as cursor:
+        cursor.execute(TOGGLE_SQL, {'user': user.pk, 'post': post_id})
+        bookmarked = cursor.fetchone() is not None
+    bump(bookmarks_key(user.pk))
+    return bookmarked
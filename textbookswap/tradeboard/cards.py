@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .stamps import POSTS, bump, versions
+
+# The markup of a post card (components/post_card.html) is the same for everyone who sees it, so it is rendered
+# once and kept in the cache. Its key carries a version stamp (see stamps.py) for the post and one for its
+# seller, and bumpPost / bumpSeller replace those stamps whenever the post, the seller's name or their profile
+# picture change, which makes the next request render a fresh card. Old cards are never looked up again and
+# simply expire.
+# The parts that depend on who is looking (the bookmark button and the seller's own buttons on the selling list)
+# are left as slots in the cached markup and filled in for every request. The slots are html comments, which
+# can never come out of the user's own text since that is escaped.
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+BOOKMARKED = mark_safe('<!--bookmarked-->')
+SELLER_INFO = mark_safe('<!--seller-info-->')
+SELLER_INFO_END = mark_safe('<!--/seller-info-->')
+SELLER_ACTIONS = mark_safe('<!--seller-actions-->')
+PK = mark_safe('<!--pk-->')
+
+SLOTS = {'bookmarked': BOOKMARKED, 'seller_info': SELLER_INFO,
+         'seller_info_end': SELLER_INFO_END, 'seller_actions': SELLER_ACTIONS}
+
+
+def post_version_key(post_id):
+    return f'post-card-version:post:{post_id}'
+
+
+def seller_version_key(user_id):
+    return f'post-card-version:seller:{user_id}'
+
+
+def bumpPost(post_id):
+    """makes the cached card of a post stale, called whenever the post is saved or deleted"""
+    bump(post_version_key(post_id))
+    # and every tab that could show it
+    bump(POSTS)
+
+
+def bumpSeller(user_id):
+    """makes the cached cards of every post of a seller stale, called when their name or profile picture change"""
+    bump(seller_version_key(user_id))
+    bump(POSTS)
+
+
+def card_keys(posts):
+    """cache key of the card of every post, which changes whenever the post or its seller does"""
+    keys = [post_version_key(post.pk) for post in posts]
+    keys += [seller_version_key(post.seller_id) for post in posts]
+    stamps = versions(list(dict.fromkeys(keys)))
+    return [f'post-card:{post.pk}:{stamps[post_version_key(post.pk)]}:{stamps[seller_version_key(post.seller_id)]}'
+            for post in posts]
+
+
+def shared_cards(posts):
+    """the viewer independent markup of every post's card, rendering and caching the ones that aren't cached"""
+    keys = card_keys(posts)
+    cached = cache.get_many(keys)
+    rendered = {}
+    for post, key in zip(posts, keys):
+        if key not in cached:
+            rendered[key] = render_to_string('tradeboard/components/post_card.html',
+                                             {'post': post, 'slots': SLOTS})
+    if rendered:
+        cache.set_many(rendered, CACHE_TIMEOUT)
+    cached.update(rendered)
+    return [cached[key] for key in keys]
+
+
+def render_cards(posts, tab, bookmarked):
+    """the cards of posts as seen on tab by a user who bookmarked the posts in bookmarked, ready for postpopulate.html"""
+    posts = list(posts)
+    if tab == 'SellList':
+        actions = render_to_string('tradeboard/components/post_seller_actions.html',
+                                   {'post': {'pk': PK}})
+    cards = []
+    for post, html in zip(posts, shared_cards(posts)):
+        html = html.replace(
+            BOOKMARKED, ' bookmarked' if post.pk in bookmarked else '')
+        if tab == 'SellList':
+            # the seller doesn't need to be told who is selling their own book
+            start = html.index(SELLER_INFO)
+            end = html.index(SELLER_INFO_END) + len(SELLER_INFO_END)
+            html = html[:start] + html[end:]
+            html = html.replace(SELLER_ACTIONS, actions.replace(PK, str(post.pk)))
+        else:
+            html = html.replace(SELLER_INFO, '').replace(
+                SELLER_INFO_END, '').replace(SELLER_ACTIONS, '')
+        cards.append(mark_safe(html))
+    return cards
@@ -0,0 +1,84 @@
+"""
+Answers the tabs and message threads a browser already has with 304 Not Modified.
+
+Every tab and thread response carries an ETag made of the version stamps (see stamps.py) of everything it
+shows, and Cache-Control: private, no-cache, so the browser keeps it and asks again with If-None-Match the
+next time the tab is opened. When the stamps haven't changed since, the view is never called. Working out the
+ETag of a tab only reads the cache. A thread takes one lookup of its row by primary key, which also gives its
+Last-Modified time.
+
+The ETag also covers the user, the url (cursor and search filters included) and the CSRF cookie, since the
+fragments carry a form token.
+"""
+import functools
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cards import seller_version_key
+from .models import MessageThread
+from .stamps import POSTS, bookmarks_key, inbox_key, versions
+
+
+def etag(request, keys):
+    stamps = versions(keys)
+    parts = [str(request.user.pk), request.get_full_path(), request.META.get('CSRF_COOKIE', '')]
+    parts += [stamps[key] for key in keys]
+    return hashlib.md5('\n'.join(parts).encode()).hexdigest()
+
+
+def postsETag(request):
+    """the post tabs and search results, which show posts and whether the user bookmarked them"""
+    return etag(request, [POSTS, bookmarks_key(request.user.pk)])
+
+
+def inboxETag(request):
+    """the buyers and sellers tabs, which show the user's threads and the posts they are about"""
+    return etag(request, [POSTS, inbox_key(request.user.pk)])
+
+
+def threadStamp(request):
+    """
+    revision, last change and participants of the thread a request asks for, looked up once per request.
+    None when the thread doesn't exist or the user has no part in it, the view answers for those.
+    """
+    if not hasattr(request, 'thread_stamp'):
+        try:
+            stamp = MessageThread.objects.filter(pk=request.GET.get('id')).values(
+                'revision', 'last_updated', 'buyer_id', 'post__seller_id').first()
+        except (TypeError, ValueError):
+            stamp = None
+        if stamp is not None and request.user.pk not in (stamp['buyer_id'], stamp['post__seller_id']):
+            stamp = None
+        request.thread_stamp = stamp
+    return request.thread_stamp
+
+
+def threadETag(request):
+    """a thread's messages, which change with its revision, and the profile pictures of both sides"""
+    stamp = threadStamp(request)
+    if stamp is None:
+        return None
+    keys = [seller_version_key(stamp['buyer_id']), seller_version_key(stamp['post__seller_id'])]
+    return f"{etag(request, keys)}-{stamp['revision']}"
+
+
+def threadLastModified(request):
+    stamp = threadStamp(request)
+    return stamp['last_updated'] if stamp is not None else None
+
+
+def conditional(etag_func, last_modified_func=None):
+    """condition() from django, with the response kept by the browser alone and always revalidated"""
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,251 @@
+"""
+Pushes changes in message threads to the users taking part in them.
+
+Whenever a message is sent, an offer is answered or retracted, or a thread is archived, an event naming the
+thread and its new revision is published to the buyer and the seller. The browser then asks for the changes
+through reload-message-thread like it already does, so events never carry any html.
+
+Events are kept by an in-memory broker living in the server process, and are delivered either as
+server-sent events by the ASGI application in textbookswap/asgi.py, or by long polling the pollEvents view
+when the site is served over WSGI. Each process has its own broker, so the site has to be served by a single
+process for every user to hear about every change.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import threading
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import transaction
+from django.http.cookie import parse_cookie
+
+from .stamps import bump, inbox_key
+
+# how many events are remembered per user for clients that reconnect or come back for their next long poll
+BUFFER_SIZE = 100
+# how long a long poll is held open before an empty answer is sent
+POLL_TIMEOUT = 25
+# how often a comment is sent down an idle event stream so that proxies don't close it
+KEEPALIVE = 15
+
+
+class Broker:
+    """keeps the latest events of every user and wakes up whoever is waiting on them"""
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.sequence = itertools.count(1)
+        self.last = 0
+        self.events = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.buffer_size))
+        # sequence number of the newest event each user lost because their buffer was full
+        self.dropped = {}
+        self.condition = threading.Condition()
+        self.listeners = collections.defaultdict(set)
+
+    def publish(self, user_ids, event):
+        """sends an event to every user in user_ids and returns the sequence number it was given"""
+        with self.condition:
+            self.last = seq = next(self.sequence)
+            event = dict(event, seq=seq)
+            for user_id in set(user_ids):
+                buffer = self.events[user_id]
+                if len(buffer) == self.buffer_size:
+                    self.dropped[user_id] = buffer[0]['seq']
+                buffer.append(event)
+                for loop, wakeup in self.listeners[user_id]:
+                    loop.call_soon_threadsafe(wakeup.set)
+            self.condition.notify_all()
+        return seq
+
+    def current(self):
+        """sequence number of the latest event, new clients start listening from here"""
+        return self.last
+
+    def since(self, user_id, seq):
+        """
+        returns the events of a user that came after seq.
+        If some of them have already been pushed out of the buffer a single reset event is returned,
+        telling the client to reload everything it shows. So is a seq this broker never handed out, which a client
+        still has from before the process restarted, and which would otherwise wait for the new sequence to catch up.
+        """
+        with self.condition:
+            if seq > self.last:
+                return [{'type': 'reset', 'seq': self.last}]
+            events = [event for event in self.events.get(
+                user_id, ()) if event['seq'] > seq]
+            if seq < self.dropped.get(user_id, 0):
+                return [{'type': 'reset', 'seq': events[-1]['seq']}]
+            return events
+
+    def wait(self, user_id, seq, timeout=POLL_TIMEOUT):
+        """blocks until the user has events after seq or the timeout runs out, used for long polling"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.since(user_id, seq), timeout)
+        return self.since(user_id, seq)
+
+    async def listen(self, user_id, seq, keepalive=KEEPALIVE):
+        """yields batches of new events for a user as they are published, or an empty batch every keepalive seconds"""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        listener = (loop, wakeup)
+        with self.condition:
+            self.listeners[user_id].add(listener)
+        try:
+            while True:
+                wakeup.clear()
+                events = self.since(user_id, seq)
+                if events:
+                    seq = events[-1]['seq']
+                    yield events
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield []
+        finally:
+            with self.condition:
+                self.listeners[user_id].discard(listener)
+
+
+broker = Broker()
+
+
+def participants(messageThread):
+    """ids of the users who can see a thread"""
+    user_ids = [messageThread.buyer_id]
+    if messageThread.post_id is not None:
+        user_ids.append(messageThread.post.seller_id)
+    return user_ids
+
+
+def publishThreadChange(messageThread, kind, user_ids=None):
+    """
+    tells both sides of a thread that it changed once the current transaction commits,
+    user_ids saves looking up the seller when the caller already knows who they are
+    """
+    event = {'type': kind, 'thread': messageThread.pk,
+             'revision': messageThread.revision}
+    if user_ids is None:
+        user_ids = participants(messageThread)
+    # and makes their messaging tabs stale
+    for user_id in user_ids:
+        bump(inbox_key(user_id))
+    transaction.on_commit(lambda: broker.publish(user_ids, event))
+
+
+def formatEvents(events):
+    """turns a batch of events into the text/event-stream wire format"""
+    if not events:
+        return b": keepalive\n\n"
+    return b"".join(
+        f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode() for event in events)
+
+
+# ****************************************************************************************
+# ASGI side, mounted in front of django by textbookswap/asgi.py
+
+STREAM_PATH = '/events/'
+POLL_PATH = '/events/poll/'
+
+
+def loadUserId(session_key):
+    """finds the logged in user of a session the same way AuthenticationMiddleware does"""
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(SimpleNamespace(session=session))
+    return user.pk if user.is_authenticated else None
+
+
+async def authenticate(scope):
+    headers = dict(scope['headers'])
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if session_key is None:
+        return None
+    return await sync_to_async(loadUserId)(session_key)
+
+
+def startingSeq(scope):
+    """where a client wants to pick up from, taken from Last-Event-ID when the browser reconnects or ?since="""
+    headers = dict(scope['headers'])
+    query = dict(pair.split('=', 1) for pair in scope['query_string'].decode(
+        'latin-1').split('&') if '=' in pair)
+    since = headers.get(b'last-event-id', b'').decode(
+        'latin-1') or query.get('since')
+    try:
+        return int(since)
+    except (TypeError, ValueError):
+        return None
+
+
+async def respond(send, status, body=b'', content_type=b'text/plain'):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), (b'cache-control', b'no-cache')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def waitForDisconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def eventStream(scope, receive, send):
+    """ASGI application streaming a user's events as server-sent events until the browser goes away"""
+    user_id = await authenticate(scope)
+    if user_id is None:
+        return await respond(send, 403)
+    seq = startingSeq(scope)
+    if seq is None:
+        seq = broker.current()
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+    disconnected = asyncio.ensure_future(waitForDisconnect(receive))
+    stream = broker.listen(user_id, seq)
+    try:
+        while True:
+            batch = asyncio.ensure_future(stream.__anext__())
+            await asyncio.wait({batch, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                batch.cancel()
+                await asyncio.wait({batch})
+                break
+            await send({'type': 'http.response.body', 'body': formatEvents(batch.result()), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        await stream.aclose()
+
+
+async def eventPoll(scope, receive, send):
+    """ASGI version of the pollEvents view, waits on the event loop instead of holding a thread"""
+    user_id = await authenticate(scope)
+    if user_id is None:
+        return await respond(send, 403)
+    seq = startingSeq(scope)
+    events = []
+    if seq is None:
+        seq = broker.current()
+    else:
+        stream = broker.listen(user_id, seq, keepalive=POLL_TIMEOUT)
+        try:
+            events = await stream.__anext__()
+        finally:
+            await stream.aclose()
+    body = json.dumps({'seq': events[-1]['seq'] if events else seq, 'events': events})
+    await respond(send, 200, body.encode(), b'application/json')
+
+
+def route(django_application):
+    """wraps the django ASGI application so that the event urls are answered here"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            return await eventStream(scope, receive, send)
+        if scope['type'] == 'http' and scope['path'] == POLL_PATH:
+            return await eventPoll(scope, receive, send)
+        return await django_application(scope, receive, send)
+    return application
@@ -3,35 +3,30 @@ from django.core.exceptions import ValidationError
 from django.core.validators import MaxLengthValidator, MaxValueValidator, MinValueValidator
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .isbn import compact, to_isbn13
 from .models import Post, Message
-# ************************************************************************
-from django.contrib.postgres.search import TrigramSimilarity
-from django.db.models.functions import Least, Greatest
-# ************************************************************************
+from . import ranking, search
 
 
 class BookSearchForm(forms.Form):
     title = forms.CharField(label="Title", max_length=100, required=False, validators=[MaxLengthValidator(100)],
-                            widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':############# ######## ######'}))
+                            widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':############# ######## ######', 'list': 'title-suggestions', 'autocomplete': 'off', 'data-suggest': 'title'}))
 
-    def validate_digit(value):
-        if (value != None and (len(value) != 10 and len(value) != 13)):
-            print(value)
-            raise ValidationError(f'Number of digits in "{value}"" is neither 10 nor 13',
-                                  params={'value': value},
-                                  )
+    # up to 17 characters so that hyphenated ISBN-13s fit
+    ISBN = forms.CharField(label="ISBN", max_length=17,
+                           required=False, widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':##########'}))
 
-    def validate_numeric(value):
-        if (not(f'{value}'.isnumeric())):
-            raise ValidationError(f'"{value}" Has non-numeric elements',
-                                  params={'value': value},
-                                  )
-
-    ISBN = forms.CharField(label="ISBN", max_length=13,
-                           validators=[validate_digit, validate_numeric], required=False, widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':##########'}))
+    def clean_ISBN(self):
+        """searches always use the ISBN-13 form, so ISBN-10s find the same posts"""
+        value = self.cleaned_data['ISBN']
+        return to_isbn13(value) if value else value
 
     author = forms.CharField(label="Author", max_length=50, required=False, validators=[MaxLengthValidator(50)],
-                             widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':##########'}))
+                             widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':##########', 'list': 'author-suggestions', 'autocomplete': 'off', 'data-suggest': 'author'}))
+
+    # words looked for in the title, author and description, course codes and the condition of the book
+    keywords = forms.CharField(label="Keywords", max_length=100, required=False, validators=[MaxLengthValidator(100)],
+                               widget=forms.TextInput(attrs={'class': "filter-text-input text-input-field", 'placeholder': ':###### ##### ### #########'}))
 
     edition = forms.IntegerField(
         label="Edition", min_value=1, max_value=100, validators=[MinValueValidator(1), MaxValueValidator(100)], required=False, widget=forms.NumberInput(attrs={'class': "filter-int-input int-input-field", 'placeholder': ':##########'}))
@@ -49,14 +44,16 @@ class BookSearchForm(forms.Form):
         label='posted since, ', widget=forms.SelectDateWidget(attrs={'class': "filter-date-select"}, months=MONTHS, empty_label=['----', '---', '--']), required=False)
 
     # **************************************************************************************************************************************************************************
+    ANY = ""
     OTHER = "Other"
     TEXTBOOK = "Textbook"
     post_types = (
+        (ANY, "Any"),
         (OTHER, "Other"),
         (TEXTBOOK, "Textbook"),
     )
     post_type = forms.ChoiceField(
-        label='book type, ', initial="Other", widget=forms.Select(attrs={'class': "filter-type-select type-select-field"}), required=False, choices=post_types)
+        label='book type, ', initial=ANY, widget=forms.Select(attrs={'class': "filter-type-select type-select-field"}), required=False, choices=post_types)
 
     # **************************************************************************************************************************************************************************
 
@@ -66,45 +63,27 @@ class BookSearchForm(forms.Form):
     TITLE = "title"
     AUTHOR = "author"
     RELEVANCE = "-similarity"
+    BEST_MATCH = "-rank"
+    # relevance, recency, price and bookmarks weighed together, see ranking.py
+    RECOMMENDED = "-score"
     sort_types = (
         (DATE_POSTED, "Date Posted"),
         (PRICE, "Price"),
         (EDITION, "Edition"),
         (TITLE, "Title"),
         (AUTHOR, "Author"),
-        (RELEVANCE, "Relevance")
+        (RELEVANCE, "Relevance"),
+        (BEST_MATCH, "Best Match"),
+        (RECOMMENDED, "Recommended")
     )
     sort_by = forms.ChoiceField(
         label='book type, ', initial=DATE_POSTED, widget=forms.Select(attrs={'class': "filter-type-select type-select-field"}), required=False, choices=sort_types)
     # **************************************************************************************************************************************************************************
 
     def filter(self):
-        search_filters = self.cleaned_data
-        posts = Post.objects.all()
-        filtered = False
-        if search_filters['author'] and search_filters['title']:
-            filtered = True
-            func = (TrigramSimilarity(
-                'author', search_filters['author']) + TrigramSimilarity(
-                'title', search_filters['title']))
-            posts = posts.annotate(similarity=func).filter(similarity__gt=0.3)
-        else:
-            if search_filters['author']:
-                filtered = True
-                posts = posts.annotate(similarity=TrigramSimilarity(
-                    'author', search_filters['author'])).filter(similarity__gt=0.3)
-            if search_filters['title']:
-                filtered = True
-                posts = posts.annotate(similarity=TrigramSimilarity(
-                    'title', search_filters['title'])).filter(similarity__gt=0.3)
-
-        if search_filters['ISBN']:
-            if(filtered):
-                posts = posts | Post.objects.filter(
-                    ISBN=search_filters['ISBN'])
-            else:
-                posts = Post.objects.filter(
-                    ISBN=search_filters['ISBN'])
+        search_filters = search.normalize(self.cleaned_data)
+        posts = search.candidates(
+            search_filters['title'], search_filters['author'], search_filters['ISBN'], search_filters['keywords'])
         if search_filters['edition']:
             posts = posts.filter(edition=search_filters['edition'])
         if search_filters['price']:
@@ -112,13 +91,12 @@ class BookSearchForm(forms.Form):
         if search_filters['posted_since']:
             posts = posts.filter(
                 date_posted__gte=search_filters['posted_since'])
-        if search_filters['sort_by'] == "-similarity":
-            if search_filters['author'] or search_filters['title']:
-                return(posts.order_by(search_filters['sort_by']))
-            else:
-                return(posts.order_by("-date_posted"))
-        else:
-            return(posts.order_by(search_filters['sort_by']))
+        if search_filters['post_type']:
+            posts = posts.filter(post_type=search_filters['post_type'])
+        if search_filters['sort_by'] == self.RECOMMENDED:
+            return ranking.rank(posts, bool(search_filters['title'] or search_filters['author'] or search_filters['keywords']))
+        # normalize only keeps -similarity and -rank when there is something to be similar to or to rank by
+        return(posts.order_by(search_filters['sort_by']))
 
 # *********************************************************************************************************************************************************************************
 
@@ -127,21 +105,18 @@ class BookSellForm(forms.ModelForm):
     title = forms.CharField(label="Title", max_length=100, required=True, validators=[MaxLengthValidator(100)],
                             widget=forms.TextInput(attrs={'class': "post-text-input text-input-field", 'placeholder': ':# # ########### ######## ###### ## ########### ######## ######'}))
 
-    def validate_digit(value):
-        if (value != None and (len(value) != 10 and len(value) != 13)):
-            print(value)
-            raise ValidationError(f'Number of digits in "{value}"" is neither 10 nor 13',
-                                  params={'value': value},
-                                  )
-
     def validate_numeric(value):
         if (not(f'{value}'.isnumeric())):
             raise ValidationError(f'"{value}" Has non-numeric elements',
                                   params={'value': value},
                                   )
 
-    ISBN = forms.CharField(label="ISBN", max_length=13,
-                           validators=[validate_digit, validate_numeric], required=True, widget=forms.TextInput(attrs={'class': "post-text-input text-input-field", 'placeholder': ':##########'}))
+    ISBN = forms.CharField(label="ISBN", max_length=17,
+                           validators=[to_isbn13], required=True, widget=forms.TextInput(attrs={'class': "post-text-input text-input-field", 'placeholder': ':##########'}))
+
+    def clean_ISBN(self):
+        """stores the ISBN the way it was typed minus the hyphens, Post.save works out the ISBN-13"""
+        return compact(self.cleaned_data['ISBN'])
 
     author = forms.CharField(label="Author", max_length=50, required=True, validators=[MaxLengthValidator(50)],
                              widget=forms.TextInput(attrs={'class': "post-text-input text-input-field", 'placeholder': ':####### # ##### ### # #####'}))
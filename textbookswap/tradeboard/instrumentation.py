@@ -0,0 +1,220 @@
+"""
+Measures where the time of every request goes.
+
+InstrumentationMiddleware times each request and, while it runs, every query sent to the database and every
+template rendered through the Templates backend (set as the template BACKEND in settings). The figures are
+added up per action: the AJAX action for /actions/<name>/, which the action view names with name(), and the
+url name for every other page. The metrics view serves them in the Prometheus text format. Each process keeps
+its own, like the event broker does.
+
+With SERVER_TIMING = True every response also carries its own figures in a Server-Timing header, which the
+network panel of the browser's developer tools shows. Requests slower than SLOW_REQUEST_SECONDS are logged as
+warnings along with their slowest queries.
+"""
+import bisect
+import collections
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the buckets of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# how many different actions get figures of their own, the rest are counted as 'other'
+MAX_ACTIONS = 100
+# how many of the slowest queries of a slow request are logged, and how much of each
+SLOW_QUERIES = 5
+SQL_LENGTH = 500
+
+current = contextvars.ContextVar('instrumentation', default=None)
+
+
+class Measurement:
+    """what one request spent its time on"""
+
+    def __init__(self):
+        self.action = None
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0
+        self.template_seconds = 0
+        self.rendering = 0
+        # (seconds, sql) of the slowest queries, the fastest of them first
+        self.slowest = []
+        self.exempt = False
+
+    def executed(self, seconds, sql):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if len(self.slowest) < SLOW_QUERIES:
+            heapq.heappush(self.slowest, (seconds, sql))
+        else:
+            heapq.heappushpop(self.slowest, (seconds, sql))
+
+
+class Metrics:
+    """totals per action of every request this process has answered"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.actions = collections.defaultdict(lambda: {
+            'requests': 0, 'seconds': 0, 'queries': 0, 'sql_seconds': 0, 'template_seconds': 0, 'bytes': 0,
+            'buckets': [0] * len(BUCKETS)})
+
+    def add(self, action, seconds, measurement, size):
+        with self.lock:
+            if action not in self.actions and len(self.actions) >= MAX_ACTIONS:
+                action = 'other'
+            totals = self.actions[action]
+            totals['requests'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += measurement.queries
+            totals['sql_seconds'] += measurement.sql_seconds
+            totals['template_seconds'] += measurement.template_seconds
+            totals['bytes'] += size
+            index = bisect.bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                totals['buckets'][index] += 1
+
+    def exposition(self):
+        """the totals in the Prometheus text format"""
+        with self.lock:
+            actions = {action: dict(totals, buckets=list(totals['buckets']))
+                       for action, totals in sorted(self.actions.items())}
+        lines = []
+
+        def metric(name, kind, help, key):
+            lines.append(f'# HELP textbookswap_{name} {help}')
+            lines.append(f'# TYPE textbookswap_{name} {kind}')
+            for action, totals in actions.items():
+                lines.append(f'textbookswap_{name}{{action="{escape(action)}"}} {totals[key]}')
+
+        lines.append('# HELP textbookswap_request_duration_seconds Time spent answering requests.')
+        lines.append('# TYPE textbookswap_request_duration_seconds histogram')
+        for action, totals in actions.items():
+            label = escape(action)
+            count = 0
+            for bound, number in zip(BUCKETS, totals['buckets']):
+                count += number
+                lines.append(f'textbookswap_request_duration_seconds_bucket{{action="{label}",le="{bound}"}} {count}')
+            lines.append(f'textbookswap_request_duration_seconds_bucket{{action="{label}",le="+Inf"}} '
+                         f'{totals["requests"]}')
+            lines.append(f'textbookswap_request_duration_seconds_sum{{action="{label}"}} {totals["seconds"]}')
+            lines.append(f'textbookswap_request_duration_seconds_count{{action="{label}"}} {totals["requests"]}')
+        metric('sql_queries_total', 'counter', 'Queries sent to the database.', 'queries')
+        metric('sql_seconds_total', 'counter', 'Time spent waiting for the database.', 'sql_seconds')
+        metric('template_seconds_total', 'counter', 'Time spent rendering templates.', 'template_seconds')
+        metric('response_bytes_total', 'counter', 'Size of the response bodies.', 'bytes')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def escape(label):
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def name(request, action):
+    """names the action the figures of request are added up under"""
+    measurement = getattr(request, 'measurement', None)
+    if measurement is not None and action:
+        measurement.action = action
+
+
+def exempt(request):
+    """keeps request out of the slow request log, for views that wait on purpose"""
+    measurement = getattr(request, 'measurement', None)
+    if measurement is not None:
+        measurement.exempt = True
+
+
+@contextmanager
+def rendering():
+    """adds the time spent inside to the template time of the current request, templates inside it excluded"""
+    measurement = current.get()
+    if measurement is None:
+        yield
+        return
+    # templates rendered by template tags are part of the outer template's time already
+    measurement.rendering += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        measurement.rendering -= 1
+        if not measurement.rendering:
+            measurement.template_seconds += time.perf_counter() - start
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with rendering():
+            return super().render(context, request)
+
+
+class Templates(DjangoTemplates):
+    """the django template backend, timing every template it renders"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def timeQuery(execute, sql, params, many, context):
+    measurement = current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if measurement is not None:
+            measurement.executed(time.perf_counter() - start, sql)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.measurement = measurement = Measurement()
+        token = current.set(measurement)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timeQuery))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        seconds = time.perf_counter() - measurement.start
+
+        action = measurement.action
+        if action is None:
+            match = request.resolver_match
+            action = match.url_name if match is not None and match.url_name else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        metrics.add(action, seconds, measurement, size)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'sql;dur={measurement.sql_seconds * 1000:.1f};desc="{measurement.queries} queries"',
+                f'template;dur={measurement.template_seconds * 1000:.1f}',
+                f'total;dur={seconds * 1000:.1f}',
+            ])
+        if seconds >= settings.SLOW_REQUEST_SECONDS and not measurement.exempt:
+            worst = ''.join(f'\n  {query_seconds * 1000:.1f}ms {sql[:SQL_LENGTH]}'
+                            for query_seconds, sql in sorted(measurement.slowest, reverse=True))
+            logger.warning('slow request %s %s (%s): %.0fms, %d queries in %.0fms, templates %.0fms%s',
+                           request.method, request.path, action, seconds * 1000, measurement.queries,
+                           measurement.sql_seconds * 1000, measurement.template_seconds * 1000, worst)
+        return response
+
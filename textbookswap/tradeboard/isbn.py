@@ -0,0 +1,53 @@
+from django.core.exceptions import ValidationError
+
+# Books carry either a 10 digit ISBN (before 2007) or a 13 digit one, and every ISBN-10 has an ISBN-13
+# twin made by prefixing 978 and recomputing the check digit. Posts store the ISBN-13 form next to whatever
+# the seller typed (Post.isbn13), so a search for either form of the number is one lookup on one index.
+
+
+def compact(value):
+    """strips the hyphens and spaces people (and barcode scanners) put in ISBNs"""
+    return f'{value}'.replace('-', '').replace(' ', '').upper()
+
+
+def all_digits(value):
+    """whether value is made of 0 to 9 only, str.isdigit also takes other scripts' digits and superscripts"""
+    return value.isascii() and value.isdigit()
+
+
+def isbn10_check_digit(first_nine):
+    total = sum((10 - i) * int(digit) for i, digit in enumerate(first_nine))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(first_twelve):
+    total = sum(int(digit) * (3 if i % 2 else 1)
+                for i, digit in enumerate(first_twelve))
+    return str((10 - total % 10) % 10)
+
+
+def to_isbn13(value):
+    """returns the ISBN-13 form of an ISBN-10 or ISBN-13, raises a ValidationError if value is neither"""
+    digits = compact(value)
+    if len(digits) == 10:
+        if not all_digits(digits[:9]) or isbn10_check_digit(digits[:9]) != digits[9]:
+            raise ValidationError(f'"{value}" is not a valid ISBN-10, please check the digits',
+                                  params={'value': value})
+        first_twelve = '978' + digits[:9]
+        return first_twelve + isbn13_check_digit(first_twelve)
+    if len(digits) == 13:
+        if not all_digits(digits) or isbn13_check_digit(digits[:12]) != digits[12]:
+            raise ValidationError(f'"{value}" is not a valid ISBN-13, please check the digits',
+                                  params={'value': value})
+        return digits
+    raise ValidationError(f'Number of digits in "{value}" is neither 10 nor 13',
+                          params={'value': value})
+
+
+def to_isbn13_or_blank(value):
+    """same as to_isbn13 but returns an empty string for ISBNs that were saved before they were validated"""
+    try:
+        return to_isbn13(value)
+    except ValidationError:
+        return ''
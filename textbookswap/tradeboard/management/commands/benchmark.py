@@ -0,0 +1,199 @@
+"""
+Times the AJAX actions of the home page (see ACTIONS in views.py) against seeded datasets of increasing size:
+
+    python manage.py benchmark --sizes 1000 10000 100000 --output benchmark.json
+
+The benchmark runs in a test database of its own, which generatedata fills up to each size in turn. Every action
+is sent through the django test client --repeat times (after one warm up request, so the caches are as warm as
+they are on a busy site), and its p50 and p95 latency, number of queries, number of those that wrote something
+(INSERT, UPDATE or DELETE, so the statements a sent message costs) and response size are written to --output.
+--ranking '{"recency": 2}' runs it with those weights in SEARCH_RANKING (see ranking.py), which the
+search-recommended actions are ordered by, to see what other weights cost before a deployment uses them.
+With --baseline the results are compared to an earlier run, and the command fails when an action got slower by
+more than --tolerance or runs more queries or writes than it used to. --save-baseline stores the results as
+that baseline. Latencies are only comparable between runs on the same machine, query counts always are.
+"""
+import io
+import json
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment)
+from django.urls import reverse
+
+from tradeboard import ranking
+from tradeboard.models import Post, MessageThread
+from tradeboard.views import ACTIONS
+
+
+def percentile(values, fraction):
+    """nearest rank percentile"""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def send(client, data):
+    """sends data to the url of the action data['action'] names, as GET for reads and POST for changes"""
+    data = dict(data)
+    action = data.pop('action')
+    view, methods = ACTIONS[action]
+    url = reverse('tradeboard-action', args=[action])
+    return client.get(url, data) if 'GET' in methods else client.post(url, data)
+
+
+def actions(buyer, seller, thread):
+    """the requests that are timed, as (name, user, data)"""
+    return [
+        ('initialize', buyer, {'action': 'initialize'}),
+        ('loadBookmarks', buyer, {'action': 'loadBookmarks'}),
+        ('loadSellList', seller, {'action': 'loadSellList'}),
+        ('search-default', buyer, {'action': 'search', 'sort_by': '-date_posted'}),
+        ('search-title', buyer, {'action': 'search', 'title': 'linear algebra', 'sort_by': '-similarity'}),
+        # full text over title, author and description, ranked together with the title similarity
+        ('search-keywords', buyer, {'action': 'search', 'keywords': 'math highlighting', 'sort_by': '-rank'}),
+        ('search-best-match', buyer, {'action': 'search', 'title': 'calculus', 'keywords': 'math 221',
+                                      'sort_by': '-rank'}),
+        # the ranking engine, over every open post and over the ones matching a title
+        ('search-recommended', buyer, {'action': 'search', 'sort_by': '-score'}),
+        ('search-recommended-title', buyer, {'action': 'search', 'title': 'linear algebra', 'sort_by': '-score'}),
+        ('load-message-thread', buyer, {'action': 'load-message-thread', 'id': thread.pk}),
+        ('seller-dashboard', seller, {'action': 'seller-dashboard'}),
+        # answers with the newest message only
+        ('reload-message-thread', buyer,
+         lambda: {'action': 'reload-message-thread', 'id': thread.pk,
+                  'since': MessageThread.objects.get(pk=thread.pk).revision - 1}),
+        ('send-message', buyer, {'action': 'send-message', 'messageThread': thread.pk, 'text': 'is this still available?'}),
+        ('send-offer', buyer, {'action': 'send-message', 'messageThread': thread.pk, 'text': 'how about this?',
+                               'offer': 15}),
+    ]
+
+
+def writes(queries):
+    """how many of the captured queries changed something, the statements it took to send a message"""
+    return sum(query['sql'].lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE') for query in queries)
+
+
+def measure(client, data, repeat):
+    """sends data repeat times and returns the latency, query, write and size figures"""
+    timings, queries, changes, size = [], 0, 0, 0
+    for i in range(repeat + 1):
+        body = data() if callable(data) else data
+        # the query log only keeps the last few thousand queries, seeding fills it up
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = send(client, body)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(f'{body["action"]} answered {response.status_code}')
+        if i == 0:
+            continue
+        timings.append(elapsed * 1000)
+        queries = max(queries, len(context))
+        changes = max(changes, writes(context.captured_queries))
+        size = max(size, len(response.content))
+    return {'p50_ms': round(percentile(timings, 0.5), 2), 'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': queries, 'writes': changes, 'bytes': size}
+
+
+def compare(results, baseline, tolerance):
+    """the regressions of results against baseline, as readable lines"""
+    regressions = []
+    for size, measured in results.items():
+        for action, figures in measured.items():
+            before = baseline.get(size, {}).get(action)
+            if before is None:
+                continue
+            if figures['queries'] > before['queries']:
+                regressions.append(
+                    f'{action} at {size} posts: {figures["queries"]} queries, was {before["queries"]}')
+            # baselines from before writes were counted don't have them
+            if 'writes' in before and figures['writes'] > before['writes']:
+                regressions.append(
+                    f'{action} at {size} posts: {figures["writes"]} writes, was {before["writes"]}')
+            if figures['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{action} at {size} posts: p95 {figures["p95_ms"]}ms, was {before["p95_ms"]}ms')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Times the AJAX actions of the home page against seeded datasets of increasing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='numbers of posts to seed and measure at')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='processes seeding the data, see generatedata')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--baseline', help='results of an earlier run to compare to')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='write the results to --baseline instead of comparing them')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='how much slower than the baseline an action may get, 0.2 is 20%%')
+        parser.add_argument('--ranking', type=json.loads, default={},
+                            help='JSON object of SEARCH_RANKING weights to run with instead of the configured ones')
+
+    def handle(self, *args, **options):
+        unknown = set(options['ranking']) - set(ranking.SIGNALS)
+        if unknown:
+            raise CommandError(f"no ranking signals called {', '.join(sorted(unknown))}")
+        weights = {**settings.SEARCH_RANKING, **options['ranking']}
+        self.stdout.write(f'ranking weights {json.dumps(weights, sort_keys=True)}')
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(SEARCH_RANKING=weights):
+                results = self.run(options)
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        self.stdout.write(f'results written to {options["output"]}')
+        if not options['baseline']:
+            return
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            self.stdout.write(f'baseline written to {options["baseline"]}')
+            return
+        with open(options['baseline']) as file:
+            regressions = compare(results, json.load(file), options['tolerance'])
+        if regressions:
+            raise CommandError('regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write('no regressions against the baseline')
+
+    def run(self, options):
+        results = {}
+        for seed, size in enumerate(sorted(options['sizes'])):
+            posts = size - Post.objects.count()
+            call_command('generatedata', users=max(2, posts // 10), posts=posts, seed=seed,
+                         workers=options['workers'], stdout=io.StringIO())
+            # generatedata bulk inserts, so no stamp is bumped for the posts it adds and the searches, facets and
+            # cards cached at the smaller size would still be served
+            caches['search'].clear()
+            cache.clear()
+            caches['stamps'].clear()
+            # the same thread, and so the same users, at every size
+            thread = MessageThread.objects.select_related(
+                'buyer', 'post__seller').order_by('pk').first()
+            results[str(size)] = {}
+            for name, user, data in actions(thread.buyer, thread.post.seller, thread):
+                client = Client()
+                client.force_login(user)
+                figures = measure(client, data, options['repeat'])
+                results[str(size)][name] = figures
+                self.stdout.write(f'{size:>8} {name:<24} p50 {figures["p50_ms"]:>8}ms  p95 {figures["p95_ms"]:>8}ms  '
+                                  f'{figures["queries"]:>3} queries  {figures["writes"]:>2} writes  '
+                                  f'{figures["bytes"]:>8} bytes')
+        return results
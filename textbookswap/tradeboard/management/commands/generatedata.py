@@ -0,0 +1,254 @@
+"""
+Fills the database with a large amount of made up users, posts, bookmarks and messages for load testing,
+the bulk version of createInstances.py:
+
+    python manage.py generatedata --users 50000 --posts 1000000 --messages 10000000 --workers 8
+
+Rows are inserted with bulk_create in batches, every user gets the same precomputed password hash
+(the password is PASSWORD), and the ids rows point at are drawn from lists kept in memory instead of being
+queried for. The posts are split into chunks of --batch-size posts, and each chunk is generated together with
+its bookmarks, message threads and messages by one of --workers processes, in its own transaction.
+Every chunk draws from its own random generator seeded with --seed and the chunk's number, so the same seed
+makes the same rows whatever the number of workers. Usernames carry the seed, seed more data into the same
+database with another one.
+"""
+import datetime
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.lorem_ipsum import WORDS
+
+from tradeboard.isbn import isbn13_check_digit
+from tradeboard.models import Post, Bookmark, MessageThread, Message, Inbox, CurrentOffer
+from tradeboard.negotiation import FLAGS, superseded
+from users.models import Profile
+
+PASSWORD = 'Test12345'
+
+FIRST_NAMES = ['Ada', 'Ben', 'Carla', 'Dev', 'Elena', 'Femi', 'Grace', 'Hiro', 'Ines', 'Jonah', 'Kavya', 'Liam',
+               'Maya', 'Nadav', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tara', 'Uma', 'Victor', 'Wen', 'Yusuf']
+LAST_NAMES = ['Anders', 'Brooks', 'Cohen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Huang', 'Ito', 'Jensen', 'Khan',
+              'Lopez', 'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Sato', 'Thompson', 'Vargas', 'Weber', 'Zhou']
+SUBJECTS = ['Calculus', 'Linear Algebra', 'Organic Chemistry', 'Physics', 'Microeconomics', 'Macroeconomics',
+            'Statistics', 'Biology', 'World History', 'Psychology', 'Computer Science', 'Discrete Mathematics',
+            'Sociology', 'Philosophy', 'Anthropology', 'Geology', 'Political Science', 'Neuroscience']
+TITLE_FORMS = ['{subject}', 'Introduction to {subject}', 'Principles of {subject}', '{subject}: A Modern Approach',
+               'Essentials of {subject}', '{subject} for Scientists and Engineers', 'Advanced {subject}']
+# the course codes and notes on the condition of the book descriptions start with, for the keyword search
+COURSES = ['MATH', 'CHEM', 'PHYS', 'ECON', 'STAT', 'BIOL', 'HIST', 'PSYC', 'COMP', 'PHIL', 'SOCI', 'GEOL']
+CONDITIONS = ['like new', 'some highlighting', 'notes in the margins', 'worn cover', 'never opened',
+              'missing the access code']
+# how many of the newest messages of every thread are left unseen
+UNREAD = 2
+OFFER_TEXTS = ['Would you take this?', 'Is this price ok?', 'Can you do a bit lower?', 'How about this?']
+
+
+def randomLorem(rng, length):
+    """lorem ipsum of about length characters"""
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    text = ' '.join(words)
+    return text[0].upper() + text[1:length]
+
+
+def randomISBN(rng):
+    first_twelve = '978' + ''.join(rng.choice('0123456789') for i in range(9))
+    return first_twelve + isbn13_check_digit(first_twelve)
+
+
+def share(total, start, end, whole):
+    """the part of total that falls to the items [start, end) of whole items, so that the parts add up to total"""
+    return total * end // whole - total * start // whole
+
+
+def generateUsers(number, seed, batch_size):
+    """creates number users with their profiles and returns their ids"""
+    rng = random.Random(f'{seed}:users')
+    password = make_password(PASSWORD)
+    user_ids = []
+    for start in range(0, number, batch_size):
+        users = []
+        for i in range(start, min(number, start + batch_size)):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            username = f'{first_name}.{last_name}.{seed}.{i}'.lower()
+            users.append(User(username=username, email=f'{username}@macmail.com', password=password,
+                              first_name=first_name, last_name=last_name))
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            # bulk_create doesn't send post_save, so the profiles users/signals.py would make are made here
+            Profile.objects.bulk_create([Profile(user=user) for user in users])
+            # and the inboxes of tradeboard/models.py, counted up by countUnread once every chunk is in
+            Inbox.objects.bulk_create([Inbox(user=user) for user in users])
+        user_ids += [user.pk for user in users]
+    return user_ids
+
+
+def total(threads, user, field):
+    """subquery adding up field over the threads of the inbox's user, 0 when there are none"""
+    return Coalesce(Subquery(threads.order_by().values(user).annotate(n=Sum(field)).values('n')), 0)
+
+
+def countUnread(user_ids, batch_size):
+    """fills the inboxes of the users with the unread counters of their threads, one UPDATE per batch of users"""
+    for start in range(0, len(user_ids), batch_size):
+        Inbox.objects.filter(user_id__in=user_ids[start:start + batch_size]).update(unread_messages=total(
+            MessageThread.objects.filter(buyer=OuterRef('user')), 'buyer', 'unread_by_buyer') + total(
+            MessageThread.objects.filter(post__seller=OuterRef('user')), 'post__seller', 'unread_by_seller'))
+
+
+def setUpWorker(ids):
+    # with the spawn start method the worker starts from scratch, with fork this does nothing
+    django.setup()
+    global user_ids
+    user_ids = ids
+
+
+def generateChunk(chunk, options, now):
+    """creates the posts of one chunk along with their share of the bookmarks, threads and messages"""
+    rng = random.Random(f'{options["seed"]}:chunk:{chunk}')
+    size, total = options['batch_size'], options['posts']
+    start, end = chunk * size, min(total, (chunk + 1) * size)
+    with transaction.atomic():
+        posts = []
+        for i in range(start, end):
+            ISBN = randomISBN(rng)
+            posts.append(Post(
+                seller_id=rng.choice(user_ids),
+                title=rng.choice(TITLE_FORMS).format(subject=rng.choice(SUBJECTS)),
+                ISBN=ISBN, isbn13=ISBN,
+                author=f'{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}',
+                description=f'Used for {rng.choice(COURSES)} {rng.randrange(100, 500)}, {rng.choice(CONDITIONS)}. '
+                            + randomLorem(rng, rng.randrange(30, 220)),
+                date_posted=now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 60 * 60)),
+                edition=rng.randrange(1, 15), price=rng.randrange(0, 200),
+                transaction_state=Post.COMPLETE if rng.random() < 0.2 else Post.IN_PROGRESS,
+                post_type=rng.choice([Post.OTHER, Post.TEXTBOOK])))
+        posts = Post.objects.bulk_create(posts)
+
+        pairs = set()
+        for i in range(share(options['bookmarks'], start, end, total)):
+            post = rng.choice(posts)
+            user_id = rng.choice(user_ids)
+            if user_id != post.seller_id:
+                pairs.add((user_id, post.pk))
+        Bookmark.objects.bulk_create(
+            [Bookmark(user_id=user_id, post_id=post_id, date_bookmarked=now) for user_id, post_id in sorted(pairs)])
+        by_pk = {post.pk: post for post in posts}
+        for user_id, post_id in pairs:
+            by_pk[post_id].bookmark_count += 1
+
+        threads = []
+        for i in range(share(options['threads'], start, end, total)):
+            post = rng.choice(posts)
+            buyer_id = rng.choice(user_ids)
+            while buyer_id == post.seller_id:
+                buyer_id = rng.choice(user_ids)
+            threads.append(MessageThread(post=post, buyer_id=buyer_id))
+        threads = MessageThread.objects.bulk_create(threads)
+
+        messages = []
+        # the latest offer of every thread that has one, and whether the buyer made it
+        offers = {}
+        count = share(options['messages'], start, end, total)
+        for n, thread in enumerate(threads):
+            length = count // len(threads) + (n < count % len(threads))
+            for revision in range(1, length + 1):
+                sender_id = rng.choice([thread.buyer_id, thread.post.seller_id])
+                # the newest messages of a thread haven't been read yet
+                seen = True if revision <= length - UNREAD else None
+                if seen is None and sender_id == thread.buyer_id:
+                    thread.unread_by_seller += 1
+                elif seen is None:
+                    thread.unread_by_buyer += 1
+                if rng.random() < 0.1:
+                    offer = Message(messageThread=thread, sender_id=sender_id, revision=revision, seen=seen,
+                                    text=rng.choice(OFFER_TEXTS), offer=rng.randrange(0, 200))
+                    by_buyer = sender_id == thread.buyer_id
+                    # a new offer closes the open one, like negotiation.py has it
+                    if thread.pk in offers:
+                        previous, previous_by_buyer = offers[thread.pk]
+                        for flag, value in FLAGS[superseded(previous_by_buyer, by_buyer)].items():
+                            setattr(previous, flag, value)
+                    offers[thread.pk] = (offer, by_buyer)
+                    messages.append(offer)
+                else:
+                    messages.append(Message(messageThread=thread, sender_id=sender_id, revision=revision, seen=seen,
+                                            text=randomLorem(rng, rng.randrange(30, 170))))
+            thread.revision = length
+            thread.post.thread_count += 1
+        Message.objects.bulk_create(messages, batch_size=size)
+        CurrentOffer.objects.bulk_create([CurrentOffer(
+            messageThread_id=pk, post_id=offer.messageThread.post_id, message=offer, by_buyer=by_buyer,
+            amount=offer.offer) for pk, (offer, by_buyer) in offers.items()], batch_size=size)
+        # what Message.save keeps up to date, in one statement for the whole chunk
+        MessageThread.objects.filter(pk__in=[thread.pk for thread in threads]).update(
+            highlighted_message=Subquery(Message.objects.filter(
+                messageThread=OuterRef('pk')).order_by('-revision').values('pk')[:1]))
+        MessageThread.objects.bulk_update(
+            threads, ['revision', 'unread_by_buyer', 'unread_by_seller'], batch_size=size)
+        Post.objects.bulk_update([post for post in posts if post.thread_count or post.bookmark_count],
+                                 ['thread_count', 'bookmark_count'], batch_size=size)
+    return len(posts), len(pairs), len(threads), len(messages)
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with made up users, posts, bookmarks and messages for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--bookmarks', type=int, default=None,
+                            help='defaults to 2 per post')
+        parser.add_argument('--threads', type=int, default=None,
+                            help='message threads, defaults to 1 per 2 posts')
+        parser.add_argument('--messages', type=int, default=None,
+                            help='spread evenly over the threads, defaults to 10 per post')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='processes generating posts and what belongs to them')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='posts per chunk, and rows per INSERT')
+
+    def handle(self, *args, **options):
+        posts = options['posts']
+        if options['bookmarks'] is None:
+            options['bookmarks'] = posts * 2
+        if options['threads'] is None:
+            options['threads'] = posts // 2
+        if options['messages'] is None:
+            options['messages'] = posts * 10
+        if options['users'] < 2:
+            self.stderr.write('at least 2 users are needed for anyone to buy anything')
+            return
+
+        user_ids = generateUsers(
+            options['users'], options['seed'], options['batch_size'])
+        self.stdout.write(f'{len(user_ids)} users')
+
+        now = timezone.now()
+        chunks = range(-(-posts // options['batch_size']))
+        totals = [0, 0, 0, 0]
+        if options['workers'] <= 1:
+            setUpWorker(user_ids)
+            results = (generateChunk(chunk, options, now) for chunk in chunks)
+        else:
+            # the workers open their own connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(options['workers'], initializer=setUpWorker, initargs=(user_ids,))
+            results = (future.result() for future in as_completed(
+                [pool.submit(generateChunk, chunk, options, now) for chunk in chunks]))
+        for result in results:
+            totals = [total + count for total, count in zip(totals, result)]
+            self.stdout.write('{} posts, {} bookmarks, {} threads, {} messages'.format(*totals))
+        if options['workers'] > 1:
+            pool.shutdown()
+        countUnread(user_ids, options['batch_size'])
@@ -0,0 +1,139 @@
+"""
+Appends new messages to message threads.
+
+However long a thread is, sending a message to it takes the same few statements, all in one transaction:
+
+    SELECT ... FOR UPDATE   the revision, participants and current offer of the thread, which also keeps
+                            concurrent senders in line
+    UPDATE                  closes the thread's open offer, only when the message is an offer itself
+    INSERT                  the message
+    INSERT or UPDATE        the thread's current offer, again only for offers (see negotiation.py)
+    UPDATE                  the thread's revision, highlighted message, last change and unread counter
+    UPDATE                  the inbox of the recipient
+
+Message.save sends every new message through append(). appendMany() does the same for any number of messages
+over any number of threads, with a single INSERT and a single UPDATE of the threads and of the inboxes, for
+messages the site posts itself.
+"""
+import collections
+import functools
+import operator
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import negotiation, thumbnails
+from .events import publishThreadChange
+from .models import CurrentOffer, Inbox, Message, MessageThread
+
+
+def append(message):
+    """inserts a new message at the end of its thread"""
+    appendMany([message])
+    return message
+
+
+def appendMany(messages):
+    """inserts new messages at the end of their threads, in the order they are given"""
+    if not messages:
+        return messages
+    now = timezone.now()
+    with transaction.atomic():
+        # the row locks are taken in the order of the primary keys, so that two batches can't deadlock
+        locked = MessageThread.objects.select_for_update(of=('self',)).filter(
+            pk__in={message.messageThread_id for message in messages}).order_by('pk').values(
+            'pk', 'revision', 'buyer_id', 'post_id', 'post__seller_id', 'current_offer__message_id',
+            'current_offer__state', 'current_offer__by_buyer')
+        threads = {row['pk']: {
+            'revision': row['revision'], 'first_revision': row['revision'], 'buyer': row['buyer_id'],
+            'post': row['post_id'], 'seller': row['post__seller_id'], 'last': None,
+            'unread_by_buyer': 0, 'unread_by_seller': 0, 'has_offer': row['current_offer__message_id'] is not None,
+            # the offer that is open when the message comes in, the id of a message already in the database or
+            # one of the messages being appended
+            'offer': (row['current_offer__message_id'], row['current_offer__by_buyer'])
+            if row['current_offer__state'] == CurrentOffer.OFFERED else None,
+            'new_offer': None,
+        } for row in locked}
+        inboxes = collections.Counter()
+        # ids of the offer messages already in the database the new offers closed
+        closed = set()
+
+        for message in messages:
+            thread = threads[message.messageThread_id]
+            thread['revision'] += 1
+            thread['last'] = message
+            message.revision = thread['revision']
+            if message.offer is not None and thread['post'] is not None:
+                by_buyer = message.sender_id == thread['buyer']
+                if thread['offer'] is not None:
+                    previous, previous_by_buyer = thread['offer']
+                    flags = negotiation.FLAGS[negotiation.superseded(previous_by_buyer, by_buyer)]
+                    if isinstance(previous, Message):
+                        for flag, value in flags.items():
+                            setattr(previous, flag, value)
+                    else:
+                        Message.objects.filter(pk=previous).update(revision=message.revision, **flags)
+                        closed.add(previous)
+                thread['offer'] = thread['new_offer'] = (message, by_buyer)
+            if message.sender_id == thread['buyer']:
+                recipient, counter = thread['seller'], 'unread_by_seller'
+            else:
+                recipient, counter = thread['buyer'], 'unread_by_buyer'
+            # the messages of a thread whose post was deleted have no one on the other side to read them
+            if recipient is not None:
+                thread[counter] += 1
+                inboxes[recipient] += 1
+
+        if len(messages) == 1:
+            messages[0].insert()
+        else:
+            Message.objects.bulk_create(messages)
+            if messages[0].pk is None:
+                findIds(messages, threads, closed)
+
+        offers = [CurrentOffer(messageThread_id=pk, post_id=thread['post'], message=thread['new_offer'][0],
+                               by_buyer=thread['new_offer'][1], amount=thread['new_offer'][0].offer,
+                               state=CurrentOffer.OFFERED, updated=now)
+                  for pk, thread in threads.items() if thread['new_offer'] is not None]
+        CurrentOffer.objects.bulk_update([offer for offer in offers if threads[offer.messageThread_id]['has_offer']],
+                                         ['message', 'by_buyer', 'amount', 'state', 'updated'])
+        CurrentOffer.objects.bulk_create(
+            [offer for offer in offers if not threads[offer.messageThread_id]['has_offer']])
+
+        MessageThread.objects.bulk_update([MessageThread(
+            pk=pk, revision=thread['revision'], last_updated=now, highlighted_message_id=thread['last'].pk,
+            unread_by_buyer=F('unread_by_buyer') + thread['unread_by_buyer'],
+            unread_by_seller=F('unread_by_seller') + thread['unread_by_seller'],
+        ) for pk, thread in threads.items()],
+            ['revision', 'last_updated', 'highlighted_message', 'unread_by_buyer', 'unread_by_seller'])
+        if inboxes:
+            Inbox.objects.bulk_update([Inbox(user_id=user_id, unread_messages=F('unread_messages') + n)
+                                       for user_id, n in inboxes.items()], ['unread_messages'])
+
+        for message in messages:
+            # the caller's copy of the thread is kept in step, the unread counters are only ever read from the rows
+            thread = threads[message.messageThread_id]
+            message.messageThread.revision = thread['revision']
+            message.messageThread.last_updated = now
+            if message is thread['last']:
+                message.messageThread.highlighted_message = message
+        for pk, thread in threads.items():
+            publishThreadChange(thread['last'].messageThread, 'message',
+                                [user_id for user_id in (thread['buyer'], thread['seller']) if user_id is not None])
+        for message in messages:
+            thumbnails.schedule(message, ('chat', 'full'), message.imageReady)
+    return messages
+
+
+def findIds(messages, threads, closed):
+    """
+    fills in the ids of bulk inserted messages on backends that don't hand them back, from the revisions they got.
+    Nothing else in the locked threads has a newer revision than what was there before, but the offers they closed.
+    """
+    ids = dict(((messageThread_id, revision), pk) for messageThread_id, revision, pk in Message.objects.filter(
+        functools.reduce(operator.or_, [Q(messageThread=pk, revision__gt=thread['first_revision'])
+                                        for pk, thread in threads.items()])).exclude(pk__in=closed).values_list(
+        'messageThread_id', 'revision', 'pk'))
+    for message in messages:
+        message.pk = ids[message.messageThread_id, message.revision]
@@ -0,0 +1,101 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# A catch-up migration with nothing to do with message revisions (0003): 0001 only has Post, and predates the
+# Message, MessageThread and Bookmark models and the current Post.description and Post.seller that were in
+# models.py already. This records them, so that the migrations after it have something to build on.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tradeboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=250)),
+                ('image', models.ImageField(blank=True, upload_to='message_pics')),
+                ('offer', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('offer_accepted', models.BooleanField(null=True)),
+                ('offer_retracted', models.BooleanField(null=True)),
+                ('time_sent', models.DateTimeField(auto_now_add=True)),
+                ('seen', models.BooleanField(null=True)),
+            ],
+            options={
+                'verbose_name': 'Message',
+                'verbose_name_plural': 'Messages',
+                'get_latest_by': 'time_sent',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='description',
+            field=models.TextField(max_length=350),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='seller',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='MessageThread',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_by_seller', models.BooleanField(default=False)),
+                ('archived_by_buyer', models.BooleanField(default=False)),
+                ('date_started', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messageThreads', to=settings.AUTH_USER_MODEL)),
+                ('highlighted_message', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='highlighted_by', to='tradeboard.Message')),
+                ('pinned_message', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pinned_by', to='tradeboard.Message')),
+                ('post', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messageThreads', to='tradeboard.Post')),
+            ],
+            options={
+                'verbose_name': 'MessageThread',
+                'verbose_name_plural': 'MessageThreads',
+                'get_latest_by': 'last_updated',
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='messageThread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='tradeboard.MessageThread'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reference',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tradeboard.Message'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='Bookmark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_bookmarked', models.DateTimeField(default=django.utils.timezone.now)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tradeboard.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Bookmarked Post',
+                'verbose_name_plural': 'Bookmarked Posts',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='bookmarks',
+            field=models.ManyToManyField(related_name='bookmarked_post', through='tradeboard.Bookmark', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0002_message_messagethread_bookmark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['messageThread', 'revision'], name='message_thread_revision_idx'),
+        ),
+    ]
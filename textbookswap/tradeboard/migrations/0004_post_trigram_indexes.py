@@ -0,0 +1,24 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:28
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0003_message_revision'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(transaction_state='In progress'), fields=['title'], name='post_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(transaction_state='In progress'), fields=['author'], name='post_author_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+from tradeboard.isbn import to_isbn13_or_blank
+
+
+def fill_isbn13(apps, schema_editor):
+    Post = apps.get_model('tradeboard', 'Post')
+    posts = list(Post.objects.only('id', 'ISBN'))
+    for post in posts:
+        post.isbn13 = to_isbn13_or_blank(post.ISBN)
+    Post.objects.bulk_update(posts, ['isbn13'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0004_post_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13),
+        ),
+        migrations.RunPython(fill_isbn13, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(transaction_state='In progress'), fields=['isbn13'], name='post_isbn13_idx'),
+        ),
+    ]
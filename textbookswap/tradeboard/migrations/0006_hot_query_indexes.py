@@ -0,0 +1,29 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0005_post_isbn13'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookmark',
+            index=models.Index(fields=['user', '-date_bookmarked'], name='bookmark_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(transaction_state='In progress'), fields=['-date_posted', '-id'], name='post_open_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(transaction_state='In progress'), fields=['seller', '-date_posted', '-id'], name='post_seller_open_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(transaction_state='In progress'), fields=['price', 'id'], name='post_open_price_idx'),
+        ),
+    ]
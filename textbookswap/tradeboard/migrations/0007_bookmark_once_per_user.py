@@ -0,0 +1,30 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+def remove_duplicate_bookmarks(apps, schema_editor):
+    Bookmark = apps.get_model('tradeboard', 'Bookmark')
+    seen = set()
+    duplicates = []
+    for pk, user_id, post_id in Bookmark.objects.order_by('date_bookmarked').values_list('id', 'user_id', 'post_id'):
+        if (user_id, post_id) in seen:
+            duplicates.append(pk)
+        seen.add((user_id, post_id))
+    Bookmark.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bookmarks,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookmark',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='bookmark_once_per_user'),
+        ),
+    ]
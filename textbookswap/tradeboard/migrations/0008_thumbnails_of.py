@@ -0,0 +1,23 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0007_bookmark_once_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='thumbnails_of',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails_of',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count(queryset, group):
+    """subquery counting the rows of queryset per group, 0 when there are none"""
+    return Coalesce(Subquery(queryset.order_by().values(group).annotate(n=Count('pk')).values('n')), 0)
+
+
+def total(queryset, group, field):
+    return Coalesce(Subquery(queryset.order_by().values(group).annotate(n=Sum(field)).values('n')), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Post = apps.get_model('tradeboard', 'Post')
+    MessageThread = apps.get_model('tradeboard', 'MessageThread')
+    Message = apps.get_model('tradeboard', 'Message')
+    Inbox = apps.get_model('tradeboard', 'Inbox')
+
+    Post.objects.update(thread_count=count(
+        MessageThread.objects.filter(post=OuterRef('pk')), 'post'))
+    unread = Message.objects.filter(~Q(seen=True), messageThread=OuterRef('pk'))
+    # a thread has two sides, whatever the buyer didn't send the seller did
+    MessageThread.objects.update(
+        unread_by_buyer=count(unread.exclude(sender=OuterRef('buyer')), 'messageThread'),
+        unread_by_seller=count(unread.filter(sender=OuterRef('buyer')), 'messageThread'))
+    Inbox.objects.bulk_create([Inbox(user_id=user_id) for user_id in User.objects.values_list('pk', flat=True)],
+                              batch_size=1000)
+    Inbox.objects.update(unread_messages=total(
+        MessageThread.objects.filter(buyer=OuterRef('user')), 'buyer', 'unread_by_buyer') + total(
+        MessageThread.objects.filter(post__seller=OuterRef('user')), 'post__seller', 'unread_by_seller'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('tradeboard', '0008_thumbnails_of'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inbox',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inbox', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_messages', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Inbox',
+                'verbose_name_plural': 'Inboxes',
+            },
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='unread_by_buyer',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='unread_by_seller',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thread_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
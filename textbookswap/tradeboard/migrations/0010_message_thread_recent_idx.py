@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0009_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['messageThread', '-time_sent', '-id'], name='message_thread_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def state(offer_accepted, offer_retracted):
+    if offer_retracted:
+        return 'Retracted'
+    if offer_accepted is None:
+        return 'Offered'
+    return 'Accepted' if offer_accepted else 'Refused'
+
+
+def record_offers(apps, schema_editor):
+    """
+    makes the latest offer of every thread its current offer, and closes the older ones that were still open
+    the way a new offer closes them now: retracted when the same side made it, refused otherwise
+    """
+    Message = apps.get_model('tradeboard', 'Message')
+    CurrentOffer = apps.get_model('tradeboard', 'CurrentOffer')
+    offers = Message.objects.filter(offer__isnull=False, messageThread__post__isnull=False).order_by(
+        'messageThread', '-time_sent', '-id').values_list(
+        'pk', 'messageThread_id', 'messageThread__post_id', 'messageThread__buyer_id', 'sender_id', 'offer',
+        'offer_accepted', 'offer_retracted')
+    current = None
+    records, retracted, refused = [], [], []
+    for pk, thread_id, post_id, buyer_id, sender_id, amount, accepted, retracted_flag in offers.iterator():
+        by_buyer = sender_id == buyer_id
+        if current is None or current.messageThread_id != thread_id:
+            current = CurrentOffer(messageThread_id=thread_id, post_id=post_id, message_id=pk, by_buyer=by_buyer,
+                                   amount=amount, state=state(accepted, retracted_flag))
+            records.append(current)
+        elif state(accepted, retracted_flag) == 'Offered':
+            (retracted if by_buyer == current.by_buyer else refused).append(pk)
+        if len(records) >= BATCH_SIZE:
+            CurrentOffer.objects.bulk_create(records)
+            records = []
+    CurrentOffer.objects.bulk_create(records)
+    for start in range(0, len(retracted), BATCH_SIZE):
+        Message.objects.filter(pk__in=retracted[start:start + BATCH_SIZE]).update(offer_retracted=True)
+    for start in range(0, len(refused), BATCH_SIZE):
+        Message.objects.filter(pk__in=refused[start:start + BATCH_SIZE]).update(offer_accepted=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0010_message_thread_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentOffer',
+            fields=[
+                ('messageThread', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_offer', serialize=False, to='tradeboard.MessageThread')),
+                ('by_buyer', models.BooleanField()),
+                ('amount', models.PositiveSmallIntegerField()),
+                ('state', models.CharField(choices=[('Offered', 'Offered'), ('Retracted', 'Retracted'), ('Accepted', 'Accepted'), ('Refused', 'Refused')], default='Offered', max_length=20)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tradeboard.Message')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_offers', to='tradeboard.Post')),
+            ],
+            options={
+                'verbose_name': 'Current Offer',
+                'verbose_name_plural': 'Current Offers',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='currentoffer',
+            index=models.Index(condition=models.Q(('by_buyer', True), ('state', 'Offered')), fields=['post', '-amount'], name='offer_open_best_idx'),
+        ),
+        migrations.RunPython(record_offers, migrations.RunPython.noop),
+    ]
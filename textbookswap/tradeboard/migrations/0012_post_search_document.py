@@ -0,0 +1,52 @@
+# Generated by Django 3.0.3 on 2026-10-17 04:09
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# The search document of a post is worked out by postgres whenever a post is inserted or one of the columns it is
+# made of changes, rows written by bulk_create and update() included. The title weighs most, then the author,
+# then the description.
+CREATE_TRIGGER = """
+CREATE FUNCTION tradeboard_post_search_document() RETURNS trigger AS $$
+BEGIN
+    NEW.search_document :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tradeboard_post_search_document
+    BEFORE INSERT OR UPDATE OF title, author, description ON tradeboard_post
+    FOR EACH ROW EXECUTE PROCEDURE tradeboard_post_search_document();
+
+-- the posts already there, the trigger fills the column in
+UPDATE tradeboard_post SET title = title;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER tradeboard_post_search_document ON tradeboard_post;
+DROP FUNCTION tradeboard_post_search_document();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0011_current_offer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(transaction_state='In progress'), fields=['search_document'], name='post_search_document_idx'),
+        ),
+    ]
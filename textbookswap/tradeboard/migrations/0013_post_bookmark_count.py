@@ -0,0 +1,28 @@
+# Generated by Django 3.0.3 on 2026-10-17 04:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_bookmarks(apps, schema_editor):
+    Post = apps.get_model('tradeboard', 'Post')
+    Bookmark = apps.get_model('tradeboard', 'Bookmark')
+    Post.objects.update(bookmark_count=Coalesce(Subquery(Bookmark.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(n=Count('pk')).values('n')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tradeboard', '0012_post_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_bookmarks, migrations.RunPython.noop),
+    ]
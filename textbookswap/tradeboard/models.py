@@ -1,11 +1,19 @@
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Manager
+from django.db.models import Count, F, Manager, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+from . import thumbnails
+from .cards import bumpPost
+from .events import participants, publishThreadChange
+from .isbn import to_isbn13, to_isbn13_or_blank
+from .stamps import bump, inbox_key
 
 # link for a good video on creating custom html forms: https://www.youtube.com/watch?v=9jDEnSm4nt8
 
@@ -19,24 +27,24 @@ class Post(models.Model):
     # ****************************************************************************************
 
     def validate_ISBN(value):
-        print(not(f'{value}'.isnumeric()))
-        if (len(value) != 10 and len(value) != 13):
-            raise ValidationError(f'number of digits in {value} is neither 10 nor 13',
-                                  params={'value': value},
-                                  )
-        elif (not(f'{value}'.isnumeric())):
-            raise ValidationError(f'{value} has non-numeric elements',
-                                  params={'value': value},
-                                  )
+        to_isbn13(value)
 
     ISBN = models.CharField(max_length=13, validators=[validate_ISBN])
+    # ISBN-13 form of the ISBN above, filled in by save() and used to look posts up by ISBN
+    isbn13 = models.CharField(max_length=13, blank=True, editable=False)
     # ****************************************************************************************
     author = models.CharField(max_length=50)
     # ****************************************************************************************
     description = models.TextField(max_length=350)
     # ****************************************************************************************
+    # the title, author and description as a weighted tsvector for the keyword search, kept up to date by the
+    # tradeboard_post_search_document trigger of migration 0012 (see search.py)
+    search_document = SearchVectorField(null=True, editable=False)
+    # ****************************************************************************************
     image = models.ImageField(
         default='default_book.png', upload_to='book_pics')
+    # name of the image the smaller copies were made from, see thumbnails.py
+    thumbnails_of = models.CharField(max_length=100, blank=True, editable=False)
     # ****************************************************************************************
     date_posted = models.DateTimeField(default=timezone.now)  # UTC time
     # ****************************************************************************************
@@ -73,12 +81,47 @@ class Post(models.Model):
     bookmarks = models.ManyToManyField(
         User, related_name="bookmarked_post", through='Bookmark')
     # ****************************************************************************************
+    # number of message threads buyers started about the post, kept up to date by the MessageThread receivers
+    thread_count = models.PositiveIntegerField(default=0, editable=False)
+    # number of users who bookmarked the post, kept up to date by bookmarks.toggle, Bookmark and its receivers
+    bookmark_count = models.PositiveIntegerField(default=0, editable=False)
+    # ****************************************************************************************
     objects = Manager()
 
     def __str__(self):
         return(f"Seller: {self.seller} | Title: {self.title} | ID: {self.pk}")
 
+    def save(self, *args, **kwargs):
+        self.isbn13 = to_isbn13_or_blank(self.ISBN)
+        super(Post, self).save(*args, **kwargs)
+        bumpPost(self.pk)
+        # typeahead reads Post through search.py, it can't be imported before this module
+        from .typeahead import postChanged
+        postChanged(self)
+        thumbnails.schedule(self, ('card', 'full'), lambda: bumpPost(self.pk))
+
     class Meta:
+        indexes = [
+            # trigram indexes used by the title and author search (see search.py)
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'],
+                     condition=models.Q(transaction_state='In progress'), name='post_title_trgm_idx'),
+            GinIndex(fields=['author'], opclasses=['gin_trgm_ops'],
+                     condition=models.Q(transaction_state='In progress'), name='post_author_trgm_idx'),
+            # full text index used by the keyword search
+            GinIndex(fields=['search_document'], condition=models.Q(transaction_state='In progress'),
+                     name='post_search_document_idx'),
+            models.Index(fields=['isbn13'], condition=models.Q(
+                transaction_state='In progress'), name='post_isbn13_idx'),
+            # newest open posts first, the tradeboard tab and the default search ordering (and posted_since ranges)
+            models.Index(fields=['-date_posted', '-id'], condition=models.Q(
+                transaction_state='In progress'), name='post_open_recent_idx'),
+            # a seller's open posts, newest first, the selling list tab
+            models.Index(fields=['seller', '-date_posted', '-id'], condition=models.Q(
+                transaction_state='In progress'), name='post_seller_open_recent_idx'),
+            # searches capped by price or sorted by price
+            models.Index(fields=['price', 'id'], condition=models.Q(
+                transaction_state='In progress'), name='post_open_price_idx'),
+        ]
         verbose_name = 'Post'
         # Name the model will appear under in the Django Admin page.
         verbose_name_plural = 'Posts'
@@ -100,8 +143,59 @@ class MessageThread(models.Model):
     pinned_message = models.OneToOneField(
         'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name="pinned_by")
 
+    # bumped every time a message in the thread is sent or changes, clients send back the revision they
+    # last saw to get only what changed since then
+    revision = models.PositiveIntegerField(default=0)
+
+    # messages each side hasn't seen yet, counted up by Message.save and down by markSeen
+    unread_by_buyer = models.PositiveIntegerField(default=0)
+    unread_by_seller = models.PositiveIntegerField(default=0)
+
     objects = Manager()
 
+    def unreadField(self, user_id):
+        """name of the unread counter of one of the thread's participants"""
+        return 'unread_by_buyer' if user_id == self.buyer_id else 'unread_by_seller'
+
+    def addUnread(self, user_id, n):
+        """adds n, which may be negative, to the unread messages of a participant in the thread and in their inbox"""
+        field = self.unreadField(user_id)
+        MessageThread.objects.filter(pk=self.pk).update(
+            **{field: Greatest(F(field) + n, 0)})
+        Inbox.objects.filter(user_id=user_id).update(
+            unread_messages=Greatest(F('unread_messages') + n, 0))
+        bump(inbox_key(user_id))
+
+    def markSeen(self, user):
+        """marks every message the other side sent as seen by user, returns how many there were"""
+        with transaction.atomic():
+            seen = self.messages.exclude(sender=user).exclude(
+                seen=True).update(seen=True)
+            if seen:
+                self.addUnread(user.pk, -seen)
+        return seen
+
+    def nextRevision(self):
+        """increments the revision of the thread and returns the new value, should be called inside a transaction"""
+        # the UPDATE locks the row until the transaction ends, so concurrent writers each get their own revision
+        MessageThread.objects.filter(pk=self.pk).update(
+            revision=models.F('revision') + 1)
+        self.revision = MessageThread.objects.values_list(
+            'revision', flat=True).get(pk=self.pk)
+        return self.revision
+
+    def archive(self, user):
+        """hides the thread from the messaging panel of one of its participants"""
+        with transaction.atomic():
+            if user == self.buyer:
+                self.archived_by_buyer = True
+            else:
+                self.archived_by_seller = True
+            self.nextRevision()
+            self.save(update_fields=[
+                      'archived_by_buyer', 'archived_by_seller', 'revision', 'last_updated'])
+            publishThreadChange(self, 'archive')
+
     def __str__(self):
         return(f"Seller: {self.post.seller.username} | Buyer: {self.buyer.username} | ID: {self.pk}")
 
@@ -119,6 +213,8 @@ class Message(models.Model):
 
     text = models.CharField(max_length=250)
     image = models.ImageField(blank=True, upload_to='message_pics')
+    # name of the image the smaller copies were made from, see thumbnails.py
+    thumbnails_of = models.CharField(max_length=100, blank=True, editable=False)
     offer = models.PositiveSmallIntegerField(blank=True, null=True)
     offer_accepted = models.BooleanField(null=True)
     offer_retracted = models.BooleanField(null=True)
@@ -129,14 +225,35 @@ class Message(models.Model):
     time_sent = models.DateTimeField(auto_now_add=True, auto_now=False)
     seen = models.BooleanField(null=True)
 
-    def retractPreviousOffers(self):
-        Message.objects.filter(
-            sender=self.sender, messageThread=self.messageThread, offer__isnull=False, time_sent__lte=timezone.now()).update(offer_retracted=True)
+    # revision of the thread when this message was last sent or changed (see MessageThread.revision)
+    revision = models.PositiveIntegerField(default=0)
 
     def save(self, *args, **kwargs):
-        super(Message, self).save(*args, **kwargs)
-        self.messageThread.highlighted_message = self
-        self.messageThread.save()
+        if self._state.adding:
+            # new messages are appended by messaging.py, which imports this module
+            from .messaging import append
+            append(self)
+            return
+        with transaction.atomic():
+            self.revision = self.messageThread.nextRevision()
+            super(Message, self).save(*args, **kwargs)
+            self.messageThread.highlighted_message = self
+            # the counters are only ever changed with UPDATEs, saving them from here would undo concurrent ones
+            self.messageThread.save(
+                update_fields=['highlighted_message', 'revision', 'last_updated'])
+            publishThreadChange(self.messageThread, 'offer')
+            thumbnails.schedule(self, ('chat', 'full'), self.imageReady)
+
+    def insert(self):
+        """writes a new message to the database and nothing else, the rest of sending it is up to messaging.append"""
+        super(Message, self).save(force_insert=True)
+
+    def imageReady(self):
+        """has the participants reload the message now that its image has smaller copies"""
+        with transaction.atomic():
+            revision = self.messageThread.nextRevision()
+            Message.objects.filter(pk=self.pk).update(revision=revision)
+            publishThreadChange(self.messageThread, 'image')
 
     objects = Manager()
 
@@ -145,11 +262,75 @@ class Message(models.Model):
 
     class Meta:
         get_latest_by = 'time_sent'
+        indexes = [
+            models.Index(fields=['messageThread', 'revision'],
+                         name='message_thread_revision_idx'),
+            # a thread's messages newest first, one page at a time (see pagination.py)
+            models.Index(fields=['messageThread', '-time_sent', '-id'],
+                         name='message_thread_recent_idx'),
+        ]
         verbose_name = 'Message'
         # Name the model will appear under in the Django Admin page.
         verbose_name_plural = 'Messages'
 
 
+class CurrentOffer(models.Model):
+    """
+    the offer a thread is negotiating on, and where it stands (see negotiation.py).
+    Only the latest offer of a thread can still be answered, so this row is all that deciding what can happen to
+    an offer, or finding the best open offers on a seller's posts, has to read.
+    """
+    messageThread = models.OneToOneField(
+        MessageThread, on_delete=models.CASCADE, primary_key=True, related_name='current_offer')
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='current_offers')
+    message = models.OneToOneField(
+        Message, on_delete=models.CASCADE, related_name='+')
+    # whether the buyer made the offer, rather than the seller asking for a price
+    by_buyer = models.BooleanField()
+    amount = models.PositiveSmallIntegerField()
+
+    OFFERED = "Offered"
+    RETRACTED = "Retracted"
+    ACCEPTED = "Accepted"
+    REFUSED = "Refused"
+    states = (
+        (OFFERED, "Offered"),
+        (RETRACTED, "Retracted"),
+        (ACCEPTED, "Accepted"),
+        (REFUSED, "Refused"),
+    )
+    state = models.CharField(max_length=20, choices=states, default=OFFERED)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = Manager()
+
+    def __str__(self):
+        return f"Offer of ${self.amount} in thread {self.messageThread_id}: {self.state}"
+
+    class Meta:
+        indexes = [
+            # the open offers buyers made on a post, highest first (see negotiation.bestOpenOffers)
+            models.Index(fields=['post', '-amount'], condition=models.Q(state='Offered', by_buyer=True),
+                         name='offer_open_best_idx'),
+        ]
+        verbose_name = 'Current Offer'
+        verbose_name_plural = 'Current Offers'
+
+
+class BookmarkQuerySet(models.QuerySet):
+    def uncount(self):
+        """takes the bookmarks off the bookmark_count of their posts, in a single UPDATE"""
+        bookmarks = self.filter(post=OuterRef('pk')).order_by().values('post').annotate(n=Count('pk')).values('n')
+        Post.objects.filter(pk__in=self.values('post')).update(
+            bookmark_count=Greatest(F('bookmark_count') - Subquery(bookmarks), 0))
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            self.uncount()
+            return super().delete()
+
+
 class Bookmark(models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE)
@@ -157,24 +338,113 @@ class Bookmark(models.Model):
         User, on_delete=models.CASCADE)
     date_bookmarked = models.DateTimeField(default=timezone.now)  # UTC time
 
-    objects = Manager()
+    # Bookmarks have no delete receivers, so the ones of a deleted post or user go in a single DELETE instead of
+    # being loaded and deleted one by one. Deleting them through the queryset or the instance counts them off their
+    # posts, and the User pre_delete receiver does so for a user's, the ones of a deleted post go with it.
+    objects = BookmarkQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Post.objects.filter(pk=self.post_id).update(bookmark_count=Greatest(F('bookmark_count') - 1, 0))
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Post with id: {self.post.pk} bookmarked by {self.user.username} at time {self.date_bookmarked }"
 
     class Meta:
+        indexes = [
+            # the bookmark tab, a user's bookmarks newest first
+            models.Index(fields=['user', '-date_bookmarked'],
+                         name='bookmark_user_recent_idx'),
+        ]
+        constraints = [
+            # lets bookmarks.toggle() add a bookmark with a single INSERT ... ON CONFLICT
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='bookmark_once_per_user'),
+        ]
         verbose_name = 'Bookmarked Post'
         # Name the model will appear under in the Django Admin page.
         verbose_name_plural = 'Bookmarked Posts'
 
 
+class Inbox(models.Model):
+    """the counters of a user's messaging panel, so that a badge costs a single row read"""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='inbox')
+    # unread messages over every thread the user takes part in, see MessageThread.addUnread
+    unread_messages = models.PositiveIntegerField(default=0)
+
+    objects = Manager()
+
+    def __str__(self):
+        return f"Inbox of {self.user.username}: {self.unread_messages} unread"
+
+    class Meta:
+        verbose_name = 'Inbox'
+        verbose_name_plural = 'Inboxes'
+
+
+@receiver(models.signals.post_save, sender=User)
+def create_inbox(sender, instance, created, **kwargs):
+    if created:
+        Inbox.objects.create(user=instance)
+
+
+@receiver(models.signals.post_save, sender=MessageThread)
+def thread_created(sender, instance, created, **kwargs):
+    """shows a new thread in the messaging tabs of both sides, the changes after that are published"""
+    if created:
+        if instance.post_id is not None:
+            Post.objects.filter(pk=instance.post_id).update(
+                thread_count=F('thread_count') + 1)
+        for user_id in participants(instance):
+            bump(inbox_key(user_id))
+
+
+@receiver(models.signals.pre_delete, sender=MessageThread)
+def thread_delete(sender, instance, **kwargs):
+    """takes the thread's unread messages out of both inboxes"""
+    if instance.post_id is not None:
+        Post.objects.filter(pk=instance.post_id).update(
+            thread_count=Greatest(F('thread_count') - 1, 0))
+    # the counters are changed by UPDATEs, the instance being deleted may not have seen the latest ones
+    counters = MessageThread.objects.filter(pk=instance.pk).values(
+        'unread_by_buyer', 'unread_by_seller').first() or {}
+    for user_id in participants(instance):
+        unread = counters.get(instance.unreadField(user_id))
+        if unread:
+            instance.addUnread(user_id, -unread)
+
+
+@receiver(models.signals.post_save, sender=Bookmark)
+def bookmark_created(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(bookmark_count=F('bookmark_count') + 1)
+
+
+@receiver(models.signals.pre_delete, sender=User)
+def user_bookmarks_deleted(sender, instance, **kwargs):
+    Bookmark.objects.filter(user=instance).uncount()
+
+
+@receiver(models.signals.pre_delete, sender=Post)
+def post_threads_orphaned(sender, instance, **kwargs):
+    """the threads of a deleted post lose their seller, so do the seller's counts of their unread messages"""
+    for messageThread in instance.messageThreads.filter(unread_by_seller__gt=0):
+        messageThread.addUnread(instance.seller_id, -messageThread.unread_by_seller)
+
+
 @receiver(models.signals.post_delete, sender=Post)
 def submission_delete(sender, instance, **kwargs):
     """
     Deletes image from filesystem
     when corresponding `Post` object is deleted.
     """
+    bumpPost(instance.pk)
+    from .typeahead import postDeleted
+    postDeleted(instance.pk)
     if not (instance.image.path == settings.MEDIA_ROOT + "/default_book.png"):
+        thumbnails.deleteVariants(instance.image.name)
         instance.image.delete(False)
     else:
         pass
@@ -0,0 +1,91 @@
+"""
+The offers buyers and sellers make each other in their message threads.
+
+A thread negotiates on one offer at a time, its CurrentOffer: the latest offer message sent to it, and where it
+stands. An offer can only move while it is open:
+
+    offered --retract()--> retracted    by whoever made it
+    offered --accept()---> accepted     by the other side
+    offered --refuse()---> refused      by the other side
+    offered --new offer--> retracted    when the same side makes another offer
+                       --> refused      when the other side answers with an offer of their own
+
+New offers go through messaging.appendMany, which calls superseded() and records them. The offer flags of the
+messages are kept in step so that the chat screen can show the whole negotiation, but nothing decides anything
+from them: a thread has at most one open offer, so every change touches a single offer message.
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .events import publishThreadChange
+from .models import CurrentOffer, Message, MessageThread
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+# what the offer flags of a message say for each state an offer can be closed in
+FLAGS = {
+    CurrentOffer.RETRACTED: {'offer_retracted': True},
+    CurrentOffer.ACCEPTED: {'offer_accepted': True},
+    CurrentOffer.REFUSED: {'offer_accepted': False},
+}
+
+
+def superseded(open_by_buyer, new_by_buyer):
+    """the state a new offer leaves the open offer of a thread in"""
+    return CurrentOffer.RETRACTED if open_by_buyer == new_by_buyer else CurrentOffer.REFUSED
+
+
+def retract(message, user):
+    return move(message, user, CurrentOffer.RETRACTED)
+
+
+def accept(message, user):
+    return move(message, user, CurrentOffer.ACCEPTED)
+
+
+def refuse(message, user):
+    return move(message, user, CurrentOffer.REFUSED)
+
+
+def move(message, user, state):
+    """
+    closes the offer of message in state on behalf of user, one of the thread's participants.
+    Raises InvalidTransition unless it is the thread's open offer and user is on the side that can do that.
+    """
+    with transaction.atomic():
+        thread = MessageThread.objects.select_for_update(of=('self',)).filter(pk=message.messageThread_id).values(
+            'revision', 'buyer_id', 'post__seller_id', 'current_offer__message_id', 'current_offer__state',
+            'current_offer__by_buyer').first()
+        if (thread is None or thread['current_offer__message_id'] != message.pk
+                or thread['current_offer__state'] != CurrentOffer.OFFERED):
+            raise InvalidTransition(f"message {message.pk} isn't the open offer of its thread")
+        made_it = (user.pk == thread['buyer_id']) == thread['current_offer__by_buyer']
+        if made_it != (state == CurrentOffer.RETRACTED):
+            raise InvalidTransition(f"{user} can't move offer {message.pk} to {state}")
+
+        now = timezone.now()
+        revision = thread['revision'] + 1
+        CurrentOffer.objects.filter(pk=message.messageThread_id).update(state=state, updated=now)
+        Message.objects.filter(pk=message.pk).update(revision=revision, **FLAGS[state])
+        MessageThread.objects.filter(pk=message.messageThread_id).update(
+            revision=revision, highlighted_message=message.pk, last_updated=now)
+
+        message.revision = revision
+        for flag, value in FLAGS[state].items():
+            setattr(message, flag, value)
+        messageThread = message.messageThread
+        messageThread.revision = revision
+        messageThread.last_updated = now
+        messageThread.highlighted_message = message
+        publishThreadChange(messageThread, 'offer', [thread['buyer_id'], thread['post__seller_id']])
+    return message
+
+
+def bestOpenOffers(seller):
+    """the highest open offer buyers made on each of the seller's posts, by post id, in a single query"""
+    return dict(CurrentOffer.objects.filter(post__seller=seller, state=CurrentOffer.OFFERED, by_buyer=True).values(
+        'post').annotate(best=Max('amount')).values_list('post', 'best'))
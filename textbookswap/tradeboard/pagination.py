@@ -0,0 +1,50 @@
+import base64
+import datetime
+
+from django.db.models import Q
+
+# number of posts sent to the client per request on the tradeboard, bookmark and selling list tabs
+PAGE_SIZE = 20
+# number of messages of a thread the chat screen opens with, and loads at a time as the user scrolls up
+MESSAGE_PAGE_SIZE = 30
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    """turns the sort key of the last row on a page into an opaque string the client can send back"""
+    raw = f"{value.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """reverses encode_cursor, raises InvalidCursor if the client sent something we didn't make"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        value, pk = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+def paginate(posts, cursor=None, key='date_posted', page_size=PAGE_SIZE):
+    """
+    returns one page of posts (or messages, newest first) and the cursor of the next page.
+    Pages are found by seeking past the (key, id) of the last row sent instead of using an OFFSET,
+    so every page costs the same no matter how deep into the feed or the thread the client has scrolled.
+    The cursor is None once there is nothing more to load.
+    """
+    posts = posts.order_by(f'-{key}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        posts = posts.filter(Q(**{f'{key}__lt': value}) |
+                             Q(**{key: value, 'id__lt': pk}))
+    page = list(posts[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last = page[-1]
+        next_cursor = encode_cursor(getattr(last, key), last.pk)
+    return page, next_cursor
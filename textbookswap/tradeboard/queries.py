@@ -0,0 +1,68 @@
+from django.db.models import Max, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CurrentOffer, MessageThread
+
+# Every fragment template walks relations (post.seller.profile, messageThread.buyer, message.reference...)
+# for each row it renders. The functions below attach the joins and prefetches each fragment needs so
+# that rendering one of them costs the same handful of queries whether it shows 1 row or 1000.
+# If you add a relation to one of the templates, add it to the matching plan here as well.
+
+# columns of Post that postpopulate.html actually displays
+POST_CARD_FIELDS = (
+    'id', 'title', 'ISBN', 'author', 'description', 'image', 'thumbnails_of', 'date_posted', 'edition', 'price',
+    'transaction_state', 'post_type', 'seller',
+    'seller__username', 'seller__first_name', 'seller__last_name',
+    'seller__profile__id', 'seller__profile__user', 'seller__profile__image', 'seller__profile__thumbnails_of',
+)
+
+
+def post_cards(posts):
+    """plan for postpopulate.html (tradeboard, bookmark, selling list tabs and search results)"""
+    return posts.select_related('seller__profile').only(*POST_CARD_FIELDS)
+
+
+def thread_tiles(messageThreads):
+    """plan for a list of message thread tiles, showing the other user and the highlighted message"""
+    return messageThreads.select_related('buyer__profile', 'post__seller__profile', 'highlighted_message')
+
+
+def buyers_tab(posts):
+    """plan for message_tab_buyers.html, a seller's posts each with the threads buyers started on them"""
+    return posts.prefetch_related(
+        Prefetch('messageThreads', queryset=thread_tiles(MessageThread.objects.filter(archived_by_seller=False))))
+
+
+def sellers_tab(messageThreads):
+    """plan for message_tab_sellers.html, the threads a user started as a buyer"""
+    return thread_tiles(messageThreads)
+
+
+def chat_thread(messageThreads):
+    """plan for the header of message_chat_screen.html and the participant checks done before rendering it"""
+    return messageThreads.select_related('buyer__profile', 'post__seller__profile')
+
+
+def offer_message(messages):
+    """plan for an offer message that is being answered or retracted, along with the thread it gets rendered in"""
+    return messages.select_related('sender', 'messageThread__buyer__profile', 'messageThread__post__seller__profile')
+
+
+def thread_messages(messages):
+    """plan for message_thread_scroll.html"""
+    return messages.select_related('sender__profile', 'reference')
+
+
+def seller_dashboard(posts):
+    """
+    plan for the seller dashboard, the figures of each of a seller's posts in one grouped query.
+    The threads are the only join, the best open offer is a subquery so it doesn't multiply the rows being added
+    up, and the numbers of threads and bookmarks are the counters kept on the post.
+    """
+    best_offer = CurrentOffer.objects.filter(post=OuterRef('pk'), state=CurrentOffer.OFFERED, by_buyer=True).order_by(
+        '-amount').values('amount')[:1]
+    return posts.order_by('-date_posted', '-id').values(
+        'id', 'title', 'price', 'transaction_state', 'date_posted', 'thread_count', 'bookmark_count').annotate(
+        unread_messages=Coalesce(Sum('messageThreads__unread_by_seller'), 0),
+        last_activity=Max('messageThreads__last_updated'),
+        best_offer=Subquery(best_offer))
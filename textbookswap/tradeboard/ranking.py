@@ -0,0 +1,97 @@
+"""
+Scores posts for the Recommended search ordering.
+
+The score of a post is a weighted sum of signals, each an expression postgres works out for every post a search
+finds, roughly between 0 and 1:
+
+    relevance    how well the post matches the text searched for, the rank search.candidates annotates
+                 (ts_rank of the keywords plus the trigram similarity of the title and author), 0 without text
+    recency      halves every SEARCH_RECENCY_HALF_LIFE_DAYS since the post went up
+    price        1 for a free book down to 0 at the highest price a post can ask
+    popularity   the logarithm of the number of bookmarks, 1 at POPULAR bookmarks
+
+The weights are the SEARCH_RANKING setting, one per signal, so each deployment can tune them and the benchmark
+can try others out (see its --ranking option). Another signal is a function taking whether text was searched for
+and returning its expression, added to SIGNALS under the name its weight goes by.
+
+Posts are ordered by the score in the query, which search.results cuts off at the results it keeps, so postgres
+only keeps the best of them while it scores the rest instead of sorting them all.
+"""
+import math
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import DateTimeField, ExpressionWrapper, F, FloatField, Func, Value
+from django.db.models.functions import Ln, Power
+from django.utils import timezone
+
+# the highest price BookSellForm takes
+MAX_PRICE = 400
+# number of bookmarks a post needs for its popularity to count fully, more count a little more
+POPULAR = 20
+DAY = 24 * 60 * 60
+
+
+class Age(Func):
+    """seconds between a timestamp column and another timestamp, the later one first"""
+    arg_joiner = ' - '
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, arg_joiner=') - julianday(',
+                           template=f'((julianday(%(expressions)s)) * {DAY})', **extra_context)
+
+
+def relevance(has_text):
+    return F('rank') if has_text else None
+
+
+def recency(has_text):
+    age = Age(Value(timezone.now(), output_field=DateTimeField()), F('date_posted'))
+    return Power(Value(0.5), age / Value(float(settings.SEARCH_RECENCY_HALF_LIFE_DAYS * DAY)))
+
+
+def price(has_text):
+    return ExpressionWrapper(Value(1.0) - F('price') / Value(float(MAX_PRICE)), output_field=FloatField())
+
+
+def popularity(has_text):
+    bookmarks = ExpressionWrapper(F('bookmark_count') + Value(1.0), output_field=FloatField())
+    return Ln(bookmarks) / Value(math.log(POPULAR + 1))
+
+
+SIGNALS = {
+    'relevance': relevance,
+    'recency': recency,
+    'price': price,
+    'popularity': popularity,
+}
+
+
+def weights():
+    """the weights of SEARCH_RANKING, without the signals weighing nothing"""
+    unknown = set(settings.SEARCH_RANKING) - set(SIGNALS)
+    if unknown:
+        raise ImproperlyConfigured(f"SEARCH_RANKING weighs signals there are none of: {', '.join(sorted(unknown))}")
+    return {name: float(weight) for name, weight in settings.SEARCH_RANKING.items() if weight}
+
+
+def score(has_text):
+    """the score expression of a search, has_text when it has a title, author or keywords to be relevant to"""
+    terms = []
+    for name, weight in weights().items():
+        signal = SIGNALS[name](has_text)
+        if signal is not None:
+            terms.append(Value(weight) * signal)
+    if not terms:
+        return Value(0.0)
+    total = terms[0]
+    for term in terms[1:]:
+        total = total + term
+    return ExpressionWrapper(total, output_field=FloatField())
+
+
+def rank(posts, has_text):
+    """posts annotated with their score, best first, the newest first among equal scores"""
+    return posts.annotate(score=score(has_text)).order_by('-score', '-date_posted', '-id')
@@ -0,0 +1,114 @@
+"""
+The JSON representation of what the AJAX actions send back, for clients asking for ?format=json.
+
+The functions only read the columns and relations the plans in queries.py load, so a representation costs the
+same queries as the html fragment it stands in for.
+"""
+from .thumbnails import variantUrl
+
+
+def user(user):
+    return {'id': user.pk, 'username': user.username, 'name': user.get_full_name()}
+
+
+def image(instance, size):
+    """urls of instance.image at size, or None when it has none"""
+    if not instance.image:
+        return None
+    return {'jpg': variantUrl(instance, size, 'jpg'), 'full': variantUrl(instance, 'full', 'jpg')}
+
+
+def post(post, bookmarked=()):
+    return {
+        'id': post.pk,
+        'title': post.title,
+        'ISBN': post.ISBN,
+        'author': post.author,
+        'description': post.description,
+        'edition': post.edition,
+        'price': post.price,
+        'post_type': post.post_type,
+        'transaction_state': post.transaction_state,
+        'date_posted': post.date_posted,
+        'image': image(post, 'card'),
+        'seller': user(post.seller),
+        'bookmarked': post.pk in bookmarked,
+    }
+
+
+def listing(listing):
+    """a row of queries.seller_dashboard"""
+    return {
+        'id': listing['id'],
+        'title': listing['title'],
+        'price': listing['price'],
+        'transaction_state': listing['transaction_state'],
+        'date_posted': listing['date_posted'],
+        'threads': listing['thread_count'],
+        'unread_messages': listing['unread_messages'],
+        'best_offer': listing['best_offer'],
+        'last_activity': listing['last_activity'],
+        'bookmarks': listing['bookmark_count'],
+    }
+
+
+def message(message):
+    return {
+        'id': message.pk,
+        'revision': message.revision,
+        'sender': message.sender_id,
+        'text': message.text,
+        'image': image(message, 'chat'),
+        'offer': message.offer,
+        'offer_accepted': message.offer_accepted,
+        'offer_retracted': message.offer_retracted,
+        'reference': message.reference_id,
+        'time_sent': message.time_sent,
+    }
+
+
+def seller(messageThread):
+    """the seller of the post a thread is about, None once the post is deleted and the thread kept"""
+    return user(messageThread.post.seller) if messageThread.post is not None else None
+
+
+def thread_tile(messageThread):
+    """a thread as listed in the buyers and sellers tabs"""
+    return {
+        'id': messageThread.pk,
+        'post': {'id': messageThread.post.pk, 'title': messageThread.post.title}
+        if messageThread.post is not None else None,
+        'buyer': user(messageThread.buyer),
+        'seller': seller(messageThread),
+        'revision': messageThread.revision,
+        'unread_by_buyer': messageThread.unread_by_buyer,
+        'unread_by_seller': messageThread.unread_by_seller,
+        'last_updated': messageThread.last_updated,
+        'highlighted_message': message(messageThread.highlighted_message)
+        if messageThread.highlighted_message else None,
+    }
+
+
+def thread(messageThread, messages):
+    """a thread with its messages, newest first like the chat screen shows them"""
+    return {
+        'id': messageThread.pk,
+        'post': {'id': messageThread.post.pk, 'title': messageThread.post.title, 'seller': seller(messageThread)}
+        if messageThread.post is not None else None,
+        'buyer': user(messageThread.buyer),
+        'revision': messageThread.revision,
+        'messages': [message(each) for each in messages],
+    }
+
+
+def form(form):
+    """the values of a form's fields, and its errors once it has been submitted"""
+    fields = {}
+    for field in form:
+        value = field.value()
+        # image fields hold the stored file
+        fields[field.name] = getattr(value, 'name', value)
+    representation = {'fields': fields}
+    if form.is_bound:
+        representation['errors'] = form.errors.get_json_data()
+    return representation
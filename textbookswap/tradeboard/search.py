@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.cache import caches
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from . import queries
+from .models import Post
+from .stamps import POSTS, versions
+
+# Searches by ISBN use the isbn13 index, see isbn.py.
+# Title and author searches go through the gin_trgm_ops indexes on Post (see Post.Meta.indexes).
+# The `%` operator (the trigram_similar lookup) is what lets postgres use them: it pulls the rows sharing
+# enough trigrams with the search out of the index, and similarity is only computed for those rows instead of
+# for the whole table. `%` matches when similarity is above pg_trgm.similarity_threshold, which defaults to
+# the 0.3 the tradeboard has always used.
+# Keyword searches look at the title, author and description together, through Post.search_document and its GIN
+# index. The document is weighted (title A, author B, description C), so ts_rank puts a word found in the title
+# ahead of the same word in a description. The Best Match ordering adds that rank to the trigram similarity of
+# the title and author, when those were searched for too.
+
+# text search configuration of Post.search_document, the trigger of migration 0012 uses the same one
+CONFIG = 'english'
+
+# most posts a search sends back, the best ones according to the chosen ordering
+MAX_RESULTS = 200
+
+# The ids of the results of a search are kept in the 'search' cache (see CACHES in settings), under the search
+# filters written the same way for every way of typing them, and the version stamp of every post (see stamps.py).
+# Any post being created, edited, sold or deleted bumps that stamp, so the results of every search are looked up
+# again after that. The viewer's own posts are left out of the cached results, and the bookmarks marked on them,
+# for every request.
+# A search keeps a few more results than it shows, so that there are still enough once the viewer's posts are out.
+CACHED_RESULTS = MAX_RESULTS + 50
+
+# The facets of a search count the posts it finds for each value of the filters it could be narrowed down with:
+# every post type and edition, every maximum price of PRICE_BANDS and every number of days of AGES to have been
+# posted in. They are worked out in one query grouping the posts by all four, so even a search finding every post
+# sends back a few dozen rows, and kept in the 'search' cache like the results.
+PRICE_BANDS = (10, 25, 50, 100)
+AGES = (1, 7, 30, 365)
+
+
+def open_posts():
+    """posts that can still be bought, the indexes only cover these"""
+    return Post.objects.filter(transaction_state=Post.IN_PROGRESS)
+
+
+def candidates(title, author, isbn13, keywords=''):
+    """
+    open posts whose title or author is similar to the search, whose ISBN is the one searched for or whose
+    title, author and description have every keyword, annotated with the similarity of their title and author
+    when those were searched for, and with their rank for the Best Match ordering.
+    The conditions are OR'ed in a single WHERE so postgres can combine the trigram indexes, the full text index
+    and the isbn13 index in one bitmap scan, and a search by ISBN alone is a single probe of the isbn13 index.
+    """
+    posts = open_posts()
+    matches = Q()
+    if title:
+        matches |= Q(title__trigram_similar=title)
+    if author:
+        matches |= Q(author__trigram_similar=author)
+    if isbn13:
+        matches |= Q(isbn13=isbn13)
+    if keywords:
+        query = SearchQuery(keywords, config=CONFIG)
+        matches |= Q(search_document=query)
+    posts = posts.filter(matches)
+    if title and author:
+        posts = posts.annotate(similarity=TrigramSimilarity(
+            'author', author) + TrigramSimilarity('title', title))
+    elif author:
+        posts = posts.annotate(
+            similarity=TrigramSimilarity('author', author))
+    elif title:
+        posts = posts.annotate(similarity=TrigramSimilarity('title', title))
+    if keywords:
+        rank = SearchRank(F('search_document'), query)
+        posts = posts.annotate(rank=rank + F('similarity') if title or author else rank)
+    elif title or author:
+        posts = posts.annotate(rank=F('similarity'))
+    return posts
+
+
+def fold(text):
+    """text case folded with single spaces, the way searches compare titles and authors"""
+    return ' '.join(text.casefold().split())
+
+
+def normalize(search_filters):
+    """
+    the cleaned data of a BookSearchForm written the one way every search finding the same posts is written:
+    case folded titles, authors and keywords with single spaces, and the ordering that is actually used
+    """
+    title = fold(search_filters['title'])
+    author = fold(search_filters['author'])
+    keywords = fold(search_filters['keywords'])
+    sort_by = search_filters['sort_by'] or '-date_posted'
+    # there is nothing to be similar to, or to rank by, without the fields they are worked out from
+    if sort_by == '-similarity' and not (title or author):
+        sort_by = '-date_posted'
+    if sort_by == '-rank' and not (title or author or keywords):
+        sort_by = '-date_posted'
+    return {
+        'title': title,
+        'author': author,
+        'keywords': keywords,
+        'ISBN': search_filters['ISBN'],
+        'edition': search_filters['edition'],
+        'price': search_filters['price'],
+        'posted_since': search_filters['posted_since'],
+        'post_type': search_filters['post_type'],
+        'sort_by': sort_by,
+    }
+
+
+def cache_key(search_filters):
+    stamp = versions([POSTS])[POSTS]
+    filters = normalize(search_filters)
+    if filters['sort_by'] == '-score':
+        # the Recommended ordering changes with the ranking settings
+        filters['ranking'] = [settings.SEARCH_RANKING, settings.SEARCH_RECENCY_HALF_LIFE_DAYS]
+    filters = json.dumps(filters, sort_keys=True, default=str)
+    return f'search:{stamp}:{hashlib.md5(filters.encode()).hexdigest()}'
+
+
+def results(search_form, viewer):
+    """the posts found by a valid BookSearchForm, best first, without the viewer's own, planned for the post cards"""
+    key = cache_key(search_form.cleaned_data)
+    found = caches['search'].get(key)
+    if found is None:
+        posts = list(queries.post_cards(search_form.filter())[:CACHED_RESULTS])
+        caches['search'].set(key, [(post.pk, post.seller_id) for post in posts])
+        return [post for post in posts if post.seller_id != viewer.pk][:MAX_RESULTS]
+    # the cards of the cached results by primary key, instead of searching again
+    ids = [pk for pk, seller_id in found if seller_id != viewer.pk][:MAX_RESULTS]
+    if not ids:
+        return []
+    posts = {post.pk: post for post in queries.post_cards(Post.objects.filter(pk__in=ids))}
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def band(field, bounds):
+    """the index in bounds of the first condition a post meets, len(bounds) when it meets none"""
+    return Case(*[When(then=Value(i), **{field: bound}) for i, bound in enumerate(bounds)],
+                default=Value(len(bounds)), output_field=IntegerField())
+
+
+def facets(search_form, viewer):
+    """the facets of the posts a valid BookSearchForm finds without the viewer's own"""
+    key = f'{cache_key(search_form.cleaned_data)}:facets:{viewer.pk}'
+    found = caches['search'].get(key)
+    if found is not None:
+        return found
+    today = timezone.localdate()
+    since = [today - datetime.timedelta(days=days) for days in AGES]
+    rows = search_form.filter().exclude(seller=viewer).order_by().annotate(
+        price_band=band('price__lte', PRICE_BANDS),
+        # the start of each day, which is where the posted_since filter starts as well
+        age=band('date_posted__gte', [timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+                                      for day in since])).values(
+        'post_type', 'edition', 'price_band', 'age').annotate(n=Count('pk'))
+
+    post_types, editions = {}, {}
+    prices, ages = [0] * (len(PRICE_BANDS) + 1), [0] * (len(AGES) + 1)
+    for row in rows:
+        post_types[row['post_type']] = post_types.get(row['post_type'], 0) + row['n']
+        if row['edition'] is not None:
+            editions[row['edition']] = editions.get(row['edition'], 0) + row['n']
+        prices[row['price_band']] += row['n']
+        ages[row['age']] += row['n']
+    # the bands hold the posts that meet one bound and not the ones before it, the filters take every post
+    # meeting a bound
+    found = {
+        'total': sum(prices),
+        'post_type': post_types,
+        'edition': [{'edition': edition, 'count': editions[edition]} for edition in sorted(editions)],
+        'price': [{'max': bound, 'count': sum(prices[:i + 1])} for i, bound in enumerate(PRICE_BANDS)],
+        'posted_since': [{'days': days, 'since': since[i], 'count': sum(ages[:i + 1])}
+                         for i, days in enumerate(AGES)],
+    }
+    caches['search'].set(key, found)
+    return found
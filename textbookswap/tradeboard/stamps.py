@@ -0,0 +1,37 @@
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+# A version stamp is a random token kept in the cache under a key standing for something that can change: a
+# post, a seller, every post at once, a user's bookmarks or a user's message threads. bump() replaces the token
+# whenever that thing changes, so anything computed from the current tokens (the key of a cached post card, the
+# ETag of a tab) changes along with it. A token that expired or was evicted from the cache is simply drawn again,
+# which costs a cache miss or a full response but never serves something stale.
+# The tokens live in the 'stamps' cache (see CACHES in settings), which every process has to share: a process
+# keeping its own would never see the bumps of the others and go on answering with what it cached before.
+
+POSTS = 'stamp:posts'
+
+
+def bookmarks_key(user_id):
+    return f'stamp:bookmarks:{user_id}'
+
+
+def inbox_key(user_id):
+    return f'stamp:inbox:{user_id}'
+
+
+def bump(key):
+    # only once the change is committed, otherwise a request could still read the old rows under the new stamp
+    transaction.on_commit(lambda: caches['stamps'].set(key, uuid.uuid4().hex))
+
+
+def versions(keys):
+    """current version stamps of keys, stamping the ones that don't have one yet"""
+    stamps = caches['stamps']
+    found = stamps.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        stamps.set_many(missing)
+    return {**found, **missing}
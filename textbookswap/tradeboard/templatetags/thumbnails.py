@@ -0,0 +1,23 @@
+from django import template
+
+from tradeboard.thumbnails import ready, variantUrl
+
+register = template.Library()
+
+
+@register.filter
+def variant(instance, kind):
+    """url of the copy of instance.image named by kind, '<size>.<ext>' like 'card.jpg', see thumbnails.py"""
+    size, ext = kind.split('.')
+    return variantUrl(instance, size, ext)
+
+
+@register.inclusion_tag('tradeboard/components/picture.html')
+def picture(instance, size, css_class, enlarge=False):
+    """
+    instance.image at size, in WebP for the browsers that take it and in JPEG for the others.
+    With enlarge the image opens in full size when clicked (see inlargeImage in home.html).
+    """
+    return {'webp': variantUrl(instance, size, 'webp') if ready(instance) else None,
+            'jpg': variantUrl(instance, size, 'jpg'), 'class': css_class,
+            'full': variantUrl(instance, 'full', 'jpg') if enlarge else None}
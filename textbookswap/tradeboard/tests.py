@@ -1,3 +1,1054 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import instrumentation, ranking, typeahead
+from .events import Broker
+from .forms import BookSearchForm
+from .management.commands.benchmark import compare, percentile, writes
+from .messaging import appendMany
+from .isbn import isbn13_check_digit, to_isbn13
+from .models import Post, Bookmark, MessageThread, Message, Inbox, CurrentOffer
+from .negotiation import bestOpenOffers
+from .search import normalize
+from .stamps import POSTS
+from .pagination import MESSAGE_PAGE_SIZE
+from .thumbnails import variantName
+from .views import ACTIONS
+
+
+def sendAction(client, data):
+    """sends data to the url of the action data['action'] names, as GET for reads and POST for changes"""
+    data = dict(data)
+    action = data.pop('action')
+    view, methods = ACTIONS[action]
+    url = reverse('tradeboard-action', args=[action])
+    return client.get(url, data) if 'GET' in methods else client.post(url, data)
+
+
+def createPost(seller, **fields):
+    """a post of seller, with fields in place of the defaults"""
+    fields = {'title': 'Linear Algebra', 'ISBN': '9780980232776', 'author': 'Strang',
+              'description': 'barely used', 'edition': 4, 'price': 20, **fields}
+    return Post.objects.create(seller=seller, **fields)
+
+
+def useTemporaryMedia(test):
+    """points MEDIA_ROOT of a test at a copy of the default images and makes image copies inline"""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location)
+    for name in ('default_book.png', 'default_profile.png'):
+        shutil.copy(os.path.join(settings.MEDIA_ROOT, name), location)
+    media = override_settings(MEDIA_ROOT=location, THUMBNAIL_WORKERS=0)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+class FragmentQueryCountTests(TestCase):
+    """every fragment should be rendered with the same small number of queries however many rows it shows"""
+
+    def setUp(self):
+        self.seller = User.objects.create_user(
+            'seller', password='password', first_name='Sally', last_name='Seller')
+        self.buyer = User.objects.create_user(
+            'buyer', password='password', first_name='Bob', last_name='Buyer')
+        post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(
+            post=post, buyer=self.buyer)
+        self.rows = 0
+
+    def addRows(self, n):
+        """adds n posts to every tab and n messages to every thread the test users can see"""
+        for i in range(n):
+            post = createPost(self.seller)
+            Bookmark.objects.create(post=post, user=self.buyer)
+            messageThread = MessageThread.objects.create(
+                post=post, buyer=self.buyer)
+            for thread in (messageThread, self.messageThread):
+                offer = Message.objects.create(
+                    sender=self.buyer, messageThread=thread, text='would you take', offer=15)
+                Message.objects.create(
+                    sender=self.seller, messageThread=thread, text='sure', reference=offer)
+        self.rows += n
+
+    def countQueries(self, user, data):
+        self.client.force_login(user)
+        # measure with cold caches, the rows were added behind their back
+        cache.clear()
+        caches['stamps'].clear()
+        caches['search'].clear()
+        with CaptureQueriesContext(connection) as context:
+            response = sendAction(self.client, data)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, user, data, limit):
+        self.addRows(1)
+        few = self.countQueries(user, data)
+        self.addRows(10)
+        many = self.countQueries(user, data)
+        self.assertEqual(few, many, f'{data["action"]} runs more queries as rows are added')
+        self.assertLessEqual(many, limit)
+
+    def test_tradeboard(self):
+        self.assertConstantQueries(self.buyer, {'action': 'initialize'}, 4)
+
+    def test_search(self):
+        # the results and their facets are a query each
+        self.assertConstantQueries(
+            self.buyer, {'action': 'search', 'sort_by': '-date_posted'}, 5)
+
+    def test_bookmarks(self):
+        self.assertConstantQueries(self.buyer, {'action': 'loadBookmarks'}, 4)
+
+    def test_sell_list(self):
+        self.assertConstantQueries(self.seller, {'action': 'loadSellList'}, 4)
+
+    def test_buyers_tab(self):
+        self.assertConstantQueries(
+            self.seller, {'action': 'load-buyers-tab'}, 5)
+
+    def test_sellers_tab(self):
+        self.assertConstantQueries(
+            self.buyer, {'action': 'load-sellers-tab'}, 4)
+
+    def test_message_thread(self):
+        self.assertConstantQueries(
+            self.buyer, {'action': 'load-message-thread', 'id': self.messageThread.pk}, 6)
+
+
+class PostCardCacheTests(TransactionTestCase):
+    """post cards are rendered once and rendered again only when the post or its seller change"""
+    CARD = 'tradeboard/components/post_card.html'
+
+    def setUp(self):
+        cache.clear()
+        caches['stamps'].clear()
+        useTemporaryMedia(self)
+        self.seller = User.objects.create_user(
+            'seller', password='password', first_name='Sally', last_name='Seller')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+
+    def load(self, user, action='initialize'):
+        self.client.force_login(user)
+        response = sendAction(self.client, {'action': action})
+        self.assertEqual(response.status_code, 200)
+        rendered = any(template.name == self.CARD for template in response.templates)
+        return json.loads(response.content)['posts'], rendered
+
+    def test_card_is_rendered_once(self):
+        html, rendered = self.load(self.buyer)
+        self.assertTrue(rendered)
+        cached, rendered = self.load(self.buyer)
+        self.assertFalse(rendered)
+        self.assertEqual(html, cached)
+
+    def test_saving_the_post_renders_it_again(self):
+        self.load(self.buyer)
+        self.post.title = 'Calculus'
+        self.post.save()
+        html, rendered = self.load(self.buyer)
+        self.assertTrue(rendered)
+        self.assertIn('Calculus', html)
+
+    def test_renaming_the_seller_renders_it_again(self):
+        self.load(self.buyer)
+        self.seller.first_name = 'Samantha'
+        self.seller.save()
+        html, rendered = self.load(self.buyer)
+        self.assertTrue(rendered)
+        self.assertIn('Samantha Seller', html)
+
+    def test_bookmark_state_is_per_viewer(self):
+        other = User.objects.create_user('other', password='password')
+        Bookmark.objects.create(user=self.buyer, post=self.post)
+        html, rendered = self.load(self.buyer)
+        self.assertIn('class = "bookmark bookmarked"', html)
+        html, rendered = self.load(other)
+        self.assertFalse(rendered)
+        self.assertIn('class = "bookmark"', html)
+        self.assertNotIn('<!--', html)
+
+    def test_sell_list_swaps_seller_info_for_seller_actions(self):
+        html, rendered = self.load(self.buyer)
+        self.assertIn('seller-info', html)
+        self.assertNotIn('seller-actions', html)
+        html, rendered = self.load(self.seller, 'loadSellList')
+        self.assertFalse(rendered)
+        self.assertNotIn('seller-info', html)
+        self.assertIn(f'editPostForm({self.post.pk})', html)
+
+
+class FileBasedPostCardCacheTests(PostCardCacheTests):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caching = override_settings(CACHES={**settings.CACHES, 'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}})
+        caching.enable()
+        self.addCleanup(caching.disable)
+        super().setUp()
+
+
+class ThumbnailTests(TransactionTestCase):
+    def setUp(self):
+        useTemporaryMedia(self)
+        self.seller = User.objects.create_user('seller', password='password')
+
+    def upload(self, width, height, orientation=1):
+        """a JPEG like a phone camera makes, with its orientation and position in the EXIF data"""
+        image = Image.new('RGB', (width, height), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        exif[0x010F] = 'PhoneMaker'
+        file = io.BytesIO()
+        image.save(file, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('photo.jpg', file.getvalue(), content_type='image/jpeg')
+
+    def test_post_image_copies(self):
+        post = createPost(self.seller, image=self.upload(3000, 1500, orientation=6))
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnails_of, post.image.name)
+        for size, side in (('card', 400), ('full', 1600)):
+            for ext in ('webp', 'jpg'):
+                with Image.open(default_storage.path(variantName(post.image.name, size, ext))) as copy:
+                    # rotated like the EXIF data said, and without the EXIF data
+                    self.assertEqual(copy.size, (side // 2, side))
+                    self.assertFalse(copy.getexif())
+
+    def test_cards_show_the_copies(self):
+        post = createPost(self.seller, image=self.upload(800, 600))
+        buyer = User.objects.create_user('buyer', password='password')
+        self.client.force_login(buyer)
+        response = sendAction(self.client, {'action': 'initialize'})
+        html = json.loads(response.content)['posts']
+        self.assertIn(default_storage.url(variantName(post.image.name, 'card', 'webp')), html)
+        self.assertIn(default_storage.url(variantName(post.image.name, 'full', 'jpg')), html)
+        self.assertNotIn(f'"{post.image.url}"', html)
+
+    def test_deleting_the_post_deletes_the_copies(self):
+        post = createPost(self.seller, image=self.upload(800, 600))
+        copy = variantName(post.image.name, 'card', 'jpg')
+        self.assertTrue(default_storage.exists(copy))
+        post.delete()
+        self.assertFalse(default_storage.exists(copy))
+
+
+@skipUnless(connection.features.can_return_rows_from_bulk_insert, 'generatedata needs the ids of bulk inserted rows')
+class GenerateDataTests(TestCase):
+    def generate(self, seed):
+        call_command('generatedata', users=10, posts=50, bookmarks=40, threads=20, messages=100,
+                     seed=seed, batch_size=20, stdout=io.StringIO())
+
+    def test_counts(self):
+        self.generate(1)
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(MessageThread.objects.count(), 20)
+        self.assertEqual(Message.objects.count(), 100)
+        self.assertLessEqual(Bookmark.objects.count(), 40)
+        post = Post.objects.first()
+        self.assertEqual(to_isbn13(post.ISBN), post.isbn13)
+
+    def test_threads_look_like_message_save_made_them(self):
+        self.generate(1)
+        for thread in MessageThread.objects.select_related('highlighted_message', 'post'):
+            self.assertEqual(thread.revision, 5)
+            self.assertEqual(thread.highlighted_message.revision, 5)
+            self.assertNotEqual(thread.buyer_id, thread.post.seller_id)
+
+    def test_counters_match_the_messages(self):
+        self.generate(1)
+        for thread in MessageThread.objects.all():
+            unread = thread.messages.exclude(seen=True)
+            self.assertEqual(thread.unread_by_buyer, unread.exclude(sender=thread.buyer_id).count())
+            self.assertEqual(thread.unread_by_seller, unread.filter(sender=thread.buyer_id).count())
+        self.assertEqual(sum(Post.objects.values_list('thread_count', flat=True)), 20)
+        self.assertEqual(sum(Post.objects.values_list('bookmark_count', flat=True)), Bookmark.objects.count())
+        self.assertEqual(sum(Inbox.objects.values_list('unread_messages', flat=True)),
+                         Message.objects.exclude(seen=True).count())
+
+    def test_one_open_offer_per_thread(self):
+        self.generate(1)
+        for offer in CurrentOffer.objects.select_related('message'):
+            open_offers = Message.objects.filter(messageThread=offer.messageThread_id, offer__isnull=False,
+                                                 offer_accepted=None).exclude(offer_retracted=True)
+            self.assertEqual(list(open_offers), [offer.message])
+
+    def test_same_seed_same_rows(self):
+        self.generate(1)
+        rows = list(Post.objects.order_by('title', 'ISBN').values_list('title', 'ISBN', 'price'))
+        User.objects.all().delete()
+        self.generate(2)
+        self.assertNotEqual(rows, list(Post.objects.order_by('title', 'ISBN').values_list('title', 'ISBN', 'price')))
+        User.objects.all().delete()
+        self.generate(1)
+        self.assertEqual(rows, list(Post.objects.order_by('title', 'ISBN').values_list('title', 'ISBN', 'price')))
+
+
+class ConditionalGetTests(TransactionTestCase):
+    """tabs and threads that haven't changed since the browser got them are answered with 304"""
+
+    def setUp(self):
+        cache.clear()
+        caches['stamps'].clear()
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+        self.client.force_login(self.buyer)
+        # the home page sets the CSRF cookie the ETags depend on
+        self.client.get('/')
+
+    def revalidate(self, data):
+        """loads an action and asks for it again with its ETag, returns the second response and its query count"""
+        first = sendAction(self.client, data)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        data = dict(data)
+        url = reverse('tradeboard-action', args=[data.pop('action')])
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(url, data, HTTP_IF_NONE_MATCH=first['ETag'])
+        return first, second, len(context)
+
+    def test_unchanged_tab(self):
+        first, second, queries = self.revalidate({'action': 'initialize'})
+        self.assertEqual(second.status_code, 304)
+        # the session and the user, nothing for the tab itself
+        self.assertEqual(queries, 2)
+
+    def test_changed_tab(self):
+        first = sendAction(self.client, {'action': 'initialize'})
+        createPost(self.seller)
+        second = self.client.get('/actions/initialize/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_changed_in_another_process(self):
+        first = sendAction(self.client, {'action': 'initialize'})
+        # a cache of its own, like the one another worker process opens, for the same stamps
+        stamps = FileBasedCache(settings.CACHES['stamps']['LOCATION'], {})
+        stamps.set(POSTS, 'bumped elsewhere')
+        second = self.client.get('/actions/initialize/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+
+    def test_other_user(self):
+        first = sendAction(self.client, {'action': 'initialize'})
+        self.client.force_login(self.seller)
+        second = self.client.get('/actions/initialize/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+
+    def test_thread(self):
+        data = {'action': 'load-message-thread', 'id': self.messageThread.pk}
+        first, second, queries = self.revalidate(data)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(queries, 3)
+
+        tab = sendAction(self.client, {'action': 'load-sellers-tab'})
+        Message.objects.create(sender=self.seller, messageThread=self.messageThread, text='still here')
+        for data, etag in ((data, first['ETag']), ({'action': 'load-sellers-tab'}, tab['ETag'])):
+            response = sendAction(self.client, dict(data))
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_someone_elses_thread(self):
+        self.client.force_login(User.objects.create_user('snoop', password='password'))
+        response = sendAction(self.client, {'action': 'load-message-thread', 'id': self.messageThread.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class SearchCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        caches['stamps'].clear()
+        caches['search'].clear()
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.posts = [createPost(self.seller, price=price) for price in (10, 20, 30)]
+
+    def search(self, user, **data):
+        """the ids of the posts a search finds, and whether it searched the posts table instead of using the cache"""
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = sendAction(self.client, dict(data, action='search', format='json'))
+        # the facets are the one grouped query
+        searched = any('"price" <=' in query['sql'] and 'GROUP BY' not in query['sql']
+                       for query in context.captured_queries)
+        self.facets = response.json()['facets']
+        return [post['id'] for post in response.json()['posts']], searched
+
+    def test_normalize(self):
+        filters = {'title': '  Linear   ALGEBRA', 'author': '', 'keywords': '', 'ISBN': '', 'edition': None,
+                   'price': None, 'posted_since': None, 'sort_by': '-similarity', 'post_type': 'Other'}
+        self.assertEqual(normalize(filters), normalize(dict(filters, title='linear algebra')))
+        self.assertEqual(normalize(dict(filters, title=''))['sort_by'], '-date_posted')
+        self.assertEqual(normalize(dict(filters, title='', keywords='MATH 221', sort_by='-rank'))['sort_by'], '-rank')
+        self.assertEqual(normalize(dict(filters, title='', sort_by='-rank'))['sort_by'], '-date_posted')
+
+    def test_cached_for_everyone_but_the_seller(self):
+        self.assertEqual(self.search(self.buyer, price=25, sort_by='price'),
+                         ([self.posts[0].pk, self.posts[1].pk], True))
+        self.assertEqual(self.search(self.buyer, price=25, sort_by='price')[1], False)
+        # a new post makes every cached search stale
+        mine = createPost(self.buyer, price=5)
+        self.assertEqual(self.search(self.buyer, price=25, sort_by='price'),
+                         ([self.posts[0].pk, self.posts[1].pk], True))
+        self.assertEqual(self.search(self.seller, price=25, sort_by='price'), ([mine.pk], False))
+
+    def test_facets(self):
+        self.search(self.buyer, price=25, sort_by='price')
+        self.assertEqual(self.facets, {
+            'total': 2,
+            'post_type': {'Other': 2},
+            'edition': [{'edition': 4, 'count': 2}],
+            'price': [{'max': 10, 'count': 1}, {'max': 25, 'count': 2}, {'max': 50, 'count': 2},
+                      {'max': 100, 'count': 2}],
+            'posted_since': [{'days': days, 'since': (timezone.localdate() - datetime.timedelta(days=days)).isoformat(),
+                              'count': 2} for days in (1, 7, 30, 365)],
+        })
+        self.posts[1].date_posted -= datetime.timedelta(days=10)
+        self.posts[1].edition = 5
+        self.posts[1].save()
+        self.search(self.buyer, price=25, sort_by='price')
+        self.assertEqual(self.facets['edition'], [{'edition': 4, 'count': 1}, {'edition': 5, 'count': 1}])
+        self.assertEqual([facet['count'] for facet in self.facets['posted_since']], [1, 1, 2, 2])
+        # the seller's own posts aren't among their results
+        self.search(self.seller, price=25, sort_by='price')
+        self.assertEqual(self.facets['total'], 0)
+
+    def test_post_type(self):
+        self.posts[0].post_type = Post.TEXTBOOK
+        self.posts[0].save()
+        self.assertEqual(self.search(self.buyer, price=25, sort_by='price')[0], [self.posts[0].pk, self.posts[1].pk])
+        self.assertEqual(self.facets['post_type'], {'Textbook': 1, 'Other': 1})
+        # the facet narrows the results down to the posts it counted
+        self.assertEqual(self.search(self.buyer, price=25, sort_by='price', post_type=Post.TEXTBOOK),
+                         ([self.posts[0].pk], True))
+        self.assertEqual(self.facets['post_type'], {'Textbook': 1})
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        now = timezone.now()
+        self.new = createPost(self.seller, price=150, date_posted=now)
+        self.cheap = createPost(self.seller, price=5, date_posted=now - datetime.timedelta(days=60))
+        self.popular = createPost(self.seller, price=150, date_posted=now - datetime.timedelta(days=60))
+        for i in range(5):
+            Bookmark.objects.create(post=self.popular, user=User.objects.create_user(f'fan{i}', password='password'))
+        self.client.force_login(self.buyer)
+
+    def recommended(self, **weights):
+        with override_settings(SEARCH_RANKING=weights):
+            response = sendAction(self.client, {'action': 'search', 'sort_by': '-score', 'format': 'json'})
+        return [post['id'] for post in response.json()['posts']]
+
+    def counted(self, context):
+        """the statements that changed the bookmark counters"""
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('UPDATE') and 'bookmark_count' in query['sql']]
+
+    def test_bookmarks_are_counted(self):
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.bookmark_count, 5)
+        Bookmark.objects.filter(post=self.popular).first().delete()
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.bookmark_count, 4)
+
+    def test_deleted_users_and_posts(self):
+        other = createPost(self.seller)
+        for fan in ('fan1', 'fan2'):
+            Bookmark.objects.create(post=other, user=User.objects.get(username=fan))
+        # the bookmarks of a deleted user are counted off all their posts at once
+        with CaptureQueriesContext(connection) as context:
+            User.objects.get(username='fan1').delete()
+        self.assertEqual(len(self.counted(context)), 1)
+        self.assertEqual(list(Post.objects.filter(pk__in=[self.popular.pk, other.pk]).order_by('pk').values_list(
+            'bookmark_count', flat=True)), [4, 1])
+        # the ones of a deleted post go with it
+        with CaptureQueriesContext(connection) as context:
+            self.popular.delete()
+        self.assertEqual(self.counted(context), [])
+        self.assertEqual(Bookmark.objects.count(), 1)
+        Bookmark.objects.filter(post=other).delete()
+        other.refresh_from_db()
+        self.assertEqual(other.bookmark_count, 0)
+
+    def test_weights(self):
+        self.assertEqual(self.recommended(recency=1), [self.new.pk, self.popular.pk, self.cheap.pk])
+        self.assertEqual(self.recommended(price=1)[0], self.cheap.pk)
+        self.assertEqual(self.recommended(popularity=1)[0], self.popular.pk)
+        # a recent post outweighs a cheap one, until price weighs more
+        self.assertEqual(self.recommended(recency=1, price=0.5)[0], self.new.pk)
+        self.assertEqual(self.recommended(recency=1, price=5)[0], self.cheap.pk)
+
+    def test_unknown_signal(self):
+        with override_settings(SEARCH_RANKING={'freshness': 1}):
+            with self.assertRaises(ImproperlyConfigured):
+                ranking.weights()
+
+
+class TypeaheadTests(TransactionTestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.algebra = createPost(self.seller, title='Linear Algebra', author='Strang')
+        createPost(self.seller, title='Linear  algebra', author='Lay')
+        createPost(self.seller, title='Linear Optimization', author='Bertsimas')
+        typeahead.rebuild()
+
+    def test_prefix_index(self):
+        index = typeahead.PrefixIndex(limit=2)
+        for value in ('Calculus', 'calculus', 'Chemistry', 'Biology'):
+            index.add(value)
+        # the index is full, biology was left out
+        self.assertEqual(index.suggest('c'), ['Calculus', 'Chemistry'])
+        self.assertEqual(index.suggest('B'), [])
+        index.remove('calculus')
+        index.remove('calculus')
+        self.assertEqual(index.suggest(' c '), ['Chemistry'])
+
+    def test_follows_post_changes_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(typeahead.suggest('title', 'LIN'), ['Linear Algebra', 'Linear Optimization'])
+        self.algebra.title = 'Abstract Algebra'
+        self.algebra.save()
+        createPost(self.seller, title='Linear Optimization', author='Luenberger')
+        # values written differently are suggested the way the first post wrote them
+        self.assertEqual(typeahead.suggest('title', 'lin'), ['Linear Optimization', 'Linear Algebra'])
+        self.algebra.transaction_state = Post.COMPLETE
+        self.algebra.save()
+        self.assertEqual(typeahead.suggest('title', 'a'), [])
+        Post.objects.filter(author='Lay').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(typeahead.suggest('title', 'lin'), ['Linear Optimization'])
+            self.assertEqual(typeahead.suggest('author', 'b'), ['Bertsimas'])
+
+    def test_action(self):
+        self.client.force_login(self.seller)
+        response = sendAction(self.client, {'action': 'suggest', 'field': 'author', 'q': 'st'})
+        self.assertEqual(response.json(), {'field': 'author', 'suggestions': ['Strang']})
+        self.assertIn('max-age=60', response['Cache-Control'])
+        response = sendAction(self.client, {'action': 'suggest', 'field': 'description', 'q': 'b'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ActionRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['stamps'].clear()
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.client.force_login(self.buyer)
+
+    def test_unknown_action(self):
+        self.assertEqual(self.client.get('/actions/no-such-action/').status_code, 404)
+
+    def test_methods(self):
+        self.assertEqual(self.client.get('/actions/bookmark/', {'pk': self.post.pk}).status_code, 405)
+        self.assertFalse(Bookmark.objects.exists())
+        self.assertEqual(self.client.post('/actions/initialize/').status_code, 405)
+
+    def test_json_representation(self):
+        Bookmark.objects.create(user=self.buyer, post=self.post)
+        response = self.client.get('/actions/initialize/', {'format': 'json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        posts = response.json()['posts']
+        self.assertEqual([(post['id'], post['bookmarked'], post['seller']['username']) for post in posts],
+                         [(self.post.pk, True, 'seller')])
+
+        messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+        response = self.client.post('/actions/send-message/?format=json',
+                                    {'messageThread': messageThread.pk, 'text': 'still available?'})
+        messages = response.json()['messages']
+        self.assertEqual([message['text'] for message in messages], ['still available?'])
+
+    def test_html_fragment(self):
+        response = self.client.get('/actions/initialize/')
+        self.assertIn(f'id = "bkm-{self.post.pk}"', response.json()['posts'])
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+
+    def counters(self):
+        self.messageThread.refresh_from_db()
+        return (self.messageThread.unread_by_buyer, self.messageThread.unread_by_seller,
+                Inbox.objects.get(user=self.buyer).unread_messages, Inbox.objects.get(user=self.seller).unread_messages)
+
+    def test_sending_and_seeing(self):
+        self.assertEqual(Post.objects.get(pk=self.post.pk).thread_count, 1)
+        for text in ('still available?', 'can you ship it?'):
+            Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text=text)
+        Message.objects.create(sender=self.seller, messageThread=self.messageThread, text='yes')
+        self.assertEqual(self.counters(), (1, 2, 1, 2))
+
+        self.client.force_login(self.seller)
+        response = sendAction(self.client, {'action': 'mark-thread-seen', 'id': self.messageThread.pk})
+        self.assertEqual(response.json()['seen'], 2)
+        self.assertEqual(self.counters(), (1, 0, 1, 0))
+        with self.assertNumQueries(3):
+            response = sendAction(self.client, {'action': 'inbox'})
+        self.assertEqual(response.json(), {'unread_messages': 0})
+
+    def test_deleted_thread(self):
+        Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='still available?')
+        self.messageThread.delete()
+        self.assertEqual(Inbox.objects.get(user=self.seller).unread_messages, 0)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).thread_count, 0)
+
+    def test_someone_elses_thread(self):
+        Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='still available?')
+        self.client.force_login(User.objects.create_user('snoop', password='password'))
+        response = sendAction(self.client, {'action': 'mark-thread-seen', 'id': self.messageThread.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.counters(), (0, 1, 0, 1))
+
+
+class MessageAppendTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+        self.messageThread = MessageThread.objects.select_related('post').get(pk=self.messageThread.pk)
+
+    def test_statements_per_message(self):
+        with CaptureQueriesContext(connection) as context:
+            Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='still available?')
+        # the thread lock, the insert, the thread and the inbox
+        self.assertEqual(writes(context.captured_queries), 3)
+        with CaptureQueriesContext(connection) as context:
+            Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='how about', offer=10)
+        # and the retraction of the earlier offers
+        self.assertEqual(writes(context.captured_queries), 4)
+
+    def test_offer_retracts_earlier_offers(self):
+        first = Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='a', offer=10)
+        second = Message.objects.create(sender=self.buyer, messageThread=self.messageThread, text='b', offer=12)
+        first.refresh_from_db()
+        self.assertTrue(first.offer_retracted)
+        self.assertEqual(first.revision, second.revision)
+        self.messageThread.refresh_from_db()
+        self.assertEqual((self.messageThread.revision, self.messageThread.highlighted_message_id,
+                          self.messageThread.unread_by_seller), (2, second.pk, 2))
+
+    def test_many_threads_at_once(self):
+        other = MessageThread.objects.create(post=self.post, buyer=User.objects.create_user('other'))
+        with CaptureQueriesContext(connection) as context:
+            appendMany([Message(sender=self.seller, messageThread=messageThread, text=f'sold {n}')
+                        for n, messageThread in enumerate([self.messageThread, other, self.messageThread])])
+        self.assertEqual(writes(context.captured_queries), 3)
+        self.messageThread.refresh_from_db()
+        self.assertEqual((self.messageThread.revision, self.messageThread.highlighted_message.text,
+                          self.messageThread.unread_by_buyer), (2, 'sold 2', 2))
+        self.assertEqual(list(Message.objects.filter(messageThread=self.messageThread).order_by(
+            'revision').values_list('text', 'revision')), [('sold 0', 1), ('sold 2', 2)])
+        self.assertEqual(Inbox.objects.get(user=self.buyer).unread_messages, 2)
+        self.assertEqual(Inbox.objects.get(user=other.buyer).unread_messages, 1)
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+        appendMany([Message(sender=self.buyer, messageThread=self.messageThread, text=f'message {n}')
+                    for n in range(MESSAGE_PAGE_SIZE + 5)])
+        self.client.force_login(self.buyer)
+
+    def test_pages(self):
+        response = sendAction(self.client, {'action': 'load-message-thread', 'id': self.messageThread.pk,
+                                            'format': 'json'}).json()
+        texts = [message['text'] for message in response['messages']]
+        self.assertEqual(len(texts), MESSAGE_PAGE_SIZE)
+        self.assertEqual(texts[0], f'message {MESSAGE_PAGE_SIZE + 4}')
+        older = sendAction(self.client, {'action': 'load-older-messages', 'id': self.messageThread.pk,
+                                         'cursor': response['cursor'], 'format': 'json'}).json()
+        texts += [message['text'] for message in older['messages']]
+        self.assertIsNone(older['cursor'])
+        self.assertEqual(texts, [f'message {n}' for n in reversed(range(MESSAGE_PAGE_SIZE + 5))])
+
+        response = sendAction(self.client, {'action': 'load-older-messages', 'id': self.messageThread.pk,
+                                             'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sending_answers_with_the_changes_only(self):
+        since = MessageThread.objects.get(pk=self.messageThread.pk).revision
+        response = sendAction(self.client, {'action': 'send-message', 'messageThread': self.messageThread.pk,
+                                            'text': 'how about', 'offer': 15, 'since': since}).json()
+        self.assertEqual(response['revision'], since + 1)
+        self.assertEqual([change['id'] for change in response['messages']],
+                         [Message.objects.get(text='how about').pk])
+        self.assertIn('how about', response['messages'][0]['html'])
+
+    def test_someone_elses_thread(self):
+        self.client.force_login(User.objects.create_user('snoop', password='password'))
+        response = sendAction(self.client, {'action': 'load-older-messages', 'id': self.messageThread.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_thread_of_a_deleted_post(self):
+        self.post.delete()
+        response = sendAction(self.client, {'action': 'load-message-thread', 'id': self.messageThread.pk,
+                                            'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['post'])
+        tiles = sendAction(self.client, {'action': 'load-sellers-tab', 'format': 'json'}).json()['messageThreads']
+        self.assertEqual([(tile['id'], tile['post'], tile['seller']) for tile in tiles],
+                         [(self.messageThread.pk, None, None)])
+        # and the seller no longer has a part in it
+        self.client.force_login(self.seller)
+        for action in ('load-message-thread', 'load-older-messages'):
+            response = sendAction(self.client, {'action': action, 'id': self.messageThread.pk})
+            self.assertEqual(response.status_code, 403)
+
+
+class NegotiationTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.post = createPost(self.seller)
+        self.messageThread = MessageThread.objects.create(post=self.post, buyer=self.buyer)
+
+    def offer(self, sender, amount):
+        return Message.objects.create(sender=sender, messageThread=self.messageThread, text='how about', offer=amount)
+
+    def answer(self, user, action, message, **data):
+        self.client.force_login(user)
+        return sendAction(self.client, dict(data, action=action, id=message.pk))
+
+    def test_counter_offer_and_accept(self):
+        first = self.offer(self.buyer, 10)
+        counter = self.offer(self.seller, 15)
+        first.refresh_from_db()
+        self.assertIs(first.offer_accepted, False)
+        self.assertEqual(self.answer(self.seller, 'respond-to-offer', first, response='true').status_code, 409)
+
+        response = self.answer(self.buyer, 'respond-to-offer', counter, response='true')
+        self.assertEqual(response.status_code, 200)
+        counter.refresh_from_db()
+        self.assertIs(counter.offer_accepted, True)
+        offer = CurrentOffer.objects.get(messageThread=self.messageThread)
+        self.assertEqual((offer.message_id, offer.by_buyer, offer.amount, offer.state),
+                         (counter.pk, False, 15, CurrentOffer.ACCEPTED))
+        self.assertEqual(self.answer(self.seller, 'retract-offer', counter).status_code, 409)
+
+    def test_retract(self):
+        offer = self.offer(self.buyer, 10)
+        self.assertEqual(self.answer(self.seller, 'retract-offer', offer).status_code, 403)
+        self.assertEqual(self.answer(self.buyer, 'retract-offer', offer).status_code, 200)
+        offer.refresh_from_db()
+        self.assertTrue(offer.offer_retracted)
+        self.assertEqual(CurrentOffer.objects.get(messageThread=self.messageThread).state, CurrentOffer.RETRACTED)
+
+    def test_offers_appended_together(self):
+        earlier = self.offer(self.buyer, 5)
+        first, second = appendMany([
+            Message(sender=self.buyer, messageThread=self.messageThread, text='a', offer=10),
+            Message(sender=self.seller, messageThread=self.messageThread, text='b', offer=15)])
+        earlier.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((earlier.offer_retracted, first.offer_accepted), (True, False))
+        self.assertEqual(CurrentOffer.objects.get(messageThread=self.messageThread).message_id, second.pk)
+
+    def test_best_open_offers(self):
+        other = createPost(self.seller, title='Calculus', description='new', edition=1, price=30)
+        self.offer(self.buyer, 10)
+        MessageThread.objects.create(post=self.post, buyer=User.objects.create_user('other'))
+        Message.objects.create(sender_id=User.objects.get(username='other').pk, text='more',
+                               messageThread=MessageThread.objects.latest('pk'), offer=12)
+        asking = MessageThread.objects.create(post=other, buyer=self.buyer)
+        Message.objects.create(sender=self.seller, messageThread=asking, text='I want 25', offer=25)
+        with self.assertNumQueries(1):
+            self.assertEqual(bestOpenOffers(self.seller), {self.post.pk: 12})
+
+
+class SellerDashboardTests(TestCase):
+    def test_listings(self):
+        seller = User.objects.create_user('seller', password='password')
+        buyers = [User.objects.create_user(f'buyer{n}') for n in range(3)]
+        posts = [createPost(seller, title=title) for title in ('Algebra', 'Calculus')]
+        for buyer in buyers:
+            messageThread = MessageThread.objects.create(post=posts[0], buyer=buyer)
+            Message.objects.create(sender=buyer, messageThread=messageThread, text='still available?')
+            Message.objects.create(sender=buyer, messageThread=messageThread, text='how about', offer=10 + buyer.pk)
+            Bookmark.objects.create(user=buyer, post=posts[0])
+        self.client.force_login(seller)
+        with self.assertNumQueries(3):
+            listings = sendAction(self.client, {'action': 'seller-dashboard'}).json()['listings']
+        self.assertEqual([(listing['title'], listing['threads'], listing['unread_messages'], listing['bookmarks'],
+                           listing['best_offer']) for listing in listings],
+                         [('Calculus', 0, 0, 0, None), ('Algebra', 3, 6, 3, 10 + buyers[-1].pk)])
+        self.assertIsNotNone(listings[1]['last_activity'])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='password')
+        self.client.force_login(self.user)
+
+    def initialize(self):
+        return sendAction(self.client, {'action': 'initialize'})
+
+    def test_metrics_per_action(self):
+        self.initialize()
+        before = instrumentation.metrics.actions['initialize']['requests']
+        response = self.initialize()
+        totals = instrumentation.metrics.actions['initialize']
+        self.assertEqual(totals['requests'], before + 1)
+        self.assertGreater(totals['queries'], 0)
+        self.assertGreater(totals['template_seconds'], 0)
+        self.assertGreaterEqual(totals['bytes'], len(response.content))
+
+        exposition = self.client.get('/metrics/').content.decode()
+        self.assertIn(f'textbookswap_request_duration_seconds_count{{action="initialize"}} {before + 1}',
+                      exposition)
+        self.assertIn('textbookswap_sql_queries_total{action="initialize"}', exposition)
+
+    def test_metrics_forbidden_elsewhere(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_server_timing(self):
+        with self.settings(SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.initialize())
+        with self.settings(SERVER_TIMING=True):
+            self.assertRegex(self.initialize()['Server-Timing'],
+                             r'^sql;dur=[\d.]+;desc="\d+ queries", template;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_slow_request_log(self):
+        with self.settings(SLOW_REQUEST_SECONDS=0), self.assertLogs('tradeboard.instrumentation', 'WARNING') as logs:
+            self.initialize()
+        self.assertIn('slow request GET /actions/initialize/ (initialize)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class IsbnTests(SimpleTestCase):
+    def test_to_isbn13(self):
+        self.assertEqual(to_isbn13('0-9802327-7-5'), '9780980232776')
+        self.assertEqual(to_isbn13('978 0980232776'), '9780980232776')
+
+    def test_only_ascii_digits(self):
+        for value in ('²980232774', '٩٧٨٠٩٨٠٢٣٢٧٧٦', '97809802327²6'):
+            with self.assertRaises(ValidationError):
+                to_isbn13(value)
+        form = BookSearchForm({'ISBN': '978098023277²', 'sort_by': '-date_posted'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('ISBN', form.errors)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentile(self):
+        timings = list(range(100, 0, -1))
+        self.assertEqual(percentile(timings, 0.5), 50)
+        self.assertEqual(percentile(timings, 0.95), 95)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+    def test_compare(self):
+        baseline = {'1000': {'initialize': {'p50_ms': 5, 'p95_ms': 10, 'queries': 3, 'bytes': 100}}}
+        same = {'1000': {'initialize': {'p50_ms': 5, 'p95_ms': 11, 'queries': 3, 'bytes': 100},
+                         'new-action': {'p50_ms': 5, 'p95_ms': 99, 'queries': 9, 'bytes': 100}}}
+        self.assertEqual(compare(same, baseline, 0.2), [])
+        worse = {'1000': {'initialize': {'p50_ms': 5, 'p95_ms': 13, 'queries': 4, 'bytes': 100}}}
+        self.assertEqual(len(compare(worse, baseline, 0.2)), 2)
+
+
+class BrokerTests(SimpleTestCase):
+    def test_events_only_reach_the_users_they_were_published_to(self):
+        broker = Broker()
+        seq = broker.publish([1, 2], {'type': 'message', 'thread': 5})
+        self.assertEqual(broker.since(1, 0), [
+                         {'type': 'message', 'thread': 5, 'seq': seq}])
+        self.assertEqual(broker.since(2, 0), broker.since(1, 0))
+        self.assertEqual(broker.since(3, 0), [])
+        self.assertEqual(broker.since(1, seq), [])
+
+    def test_reset_when_events_were_dropped(self):
+        broker = Broker(buffer_size=2)
+        for i in range(3):
+            broker.publish([1], {'type': 'message'})
+        self.assertEqual(broker.since(1, 0), [{'type': 'reset', 'seq': 3}])
+        self.assertEqual(len(broker.since(1, 1)), 2)
+
+    def test_reset_when_the_process_restarted(self):
+        broker = Broker()
+        broker.publish([1], {'type': 'message'})
+        # a sequence number the previous process had reached
+        self.assertEqual(broker.wait(1, 50, timeout=5), [{'type': 'reset', 'seq': 1}])
+        self.assertEqual(broker.since(1, 1), [])
+
+    def test_long_poll_wakes_up_on_publish(self):
+        broker = Broker()
+        threading.Timer(0.05, broker.publish, ([1], {'type': 'offer'})).start()
+        self.assertEqual(broker.wait(1, 0, timeout=5)[0]['type'], 'offer')
+        self.assertEqual(broker.wait(1, 1, timeout=0.01), [])
+
+    def test_listen_yields_published_events(self):
+        broker = Broker()
+
+        async def listen():
+            stream = broker.listen(1, 0)
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.05, broker.publish, [1], {'type': 'archive'})
+            events = await stream.__anext__()
+            await stream.aclose()
+            return events
+
+        self.assertEqual(asyncio.run(listen())[0]['type'], 'archive')
+
+
+@tag('slow')
+@skipUnless(connection.vendor == 'postgresql', 'query plans are only checked on postgres')
+class HotQueryPlanTests(TestCase):
+    """the tab and search queries should be answered from the indexes on a large table, never by reading all of it"""
+    POSTS = 100000
+    BIG_TABLES = ('tradeboard_post', 'tradeboard_bookmark')
+    WORDS = ['calculus', 'linear', 'algebra', 'organic', 'chemistry', 'physics', 'introduction', 'economics',
+             'statistics', 'biology', 'history', 'principles', 'programming', 'psychology', 'microeconomics']
+    CONDITIONS = ['like new', 'some highlighting', 'worn cover', 'notes in the margins', 'never opened', 'used', 'good']
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password('password')
+        cls.sellers = User.objects.bulk_create(
+            [User(username=f'seller{i}', password=password) for i in range(500)])
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        now = timezone.now()
+        posts = []
+        for i in range(cls.POSTS):
+            first_twelve = f'978{i:09d}'
+            posts.append(Post(seller=cls.sellers[i % len(cls.sellers)],
+                              title=f'{cls.WORDS[i % 15]} {cls.WORDS[(i // 15) % 15]} {i}',
+                              author=f'{cls.WORDS[(i // 7) % 15].title()} {i % 997}',
+                              ISBN=first_twelve + isbn13_check_digit(first_twelve),
+                              isbn13=first_twelve + isbn13_check_digit(first_twelve),
+                              description=f'MATH {100 + i % 400}, {cls.CONDITIONS[i % len(cls.CONDITIONS)]}',
+                              edition=i % 10 + 1, price=i % 400,
+                              date_posted=now - datetime.timedelta(minutes=i),
+                              transaction_state=Post.COMPLETE if i % 5 == 0 else Post.IN_PROGRESS))
+        posts = Post.objects.bulk_create(posts, batch_size=5000)
+        Bookmark.objects.bulk_create([Bookmark(user=cls.viewer, post=post, date_bookmarked=post.date_posted)
+                                      for post in posts[::50]])
+        with connection.cursor() as cursor:
+            for table in cls.BIG_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+    def assertIndexOnly(self, user, data):
+        """runs an action and EXPLAINs every query it sent to postgres that touches one of the big tables"""
+        self.client.force_login(user)
+        caches['search'].clear()
+        with CaptureQueriesContext(connection) as context:
+            response = sendAction(self.client, data)
+        self.assertEqual(response.status_code, 200)
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not any(table in sql for table in self.BIG_TABLES):
+                    continue
+                # the facets of a search count every post it finds, all of the open posts when nothing was typed
+                # in, and are cached along with its results (see search.facets)
+                if 'GROUP BY' in sql and 'tradeboard_post"."post_type' in sql:
+                    continue
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                for table in self.BIG_TABLES:
+                    self.assertNotIn(f'Seq Scan on {table}', plan,
+                                     f'{data["action"]} reads all of {table}:\n{sql}\n{plan}')
+        return response
+
+    def test_tradeboard(self):
+        response = self.assertIndexOnly(self.viewer, {'action': 'initialize'})
+        cursor = json.loads(response.content)['cursor']
+        self.assertIndexOnly(
+            self.viewer, {'action': 'initialize', 'cursor': cursor})
+
+    def test_sell_list(self):
+        self.assertIndexOnly(self.sellers[0], {'action': 'loadSellList'})
+
+    def test_bookmarks(self):
+        self.assertIndexOnly(self.viewer, {'action': 'loadBookmarks'})
+
+    def test_default_search(self):
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'sort_by': '-date_posted'})
+
+    def test_search_by_price(self):
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'price': 20, 'sort_by': 'price'})
+
+    def test_search_posted_since(self):
+        since = timezone.now() - datetime.timedelta(days=2)
+        self.assertIndexOnly(self.viewer, {'action': 'search', 'sort_by': '-date_posted', 'posted_since_year': since.year,
+                                           'posted_since_month': since.month, 'posted_since_day': since.day})
+
+    def test_search_by_title(self):
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'title': 'organic chemistry', 'sort_by': '-similarity'})
+
+    def test_search_by_isbn(self):
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'ISBN': '9780000012340', 'sort_by': '-date_posted'})
+
+    def test_search_by_keywords(self):
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'keywords': 'math 221 highlighting', 'sort_by': '-rank'})
+        self.assertIndexOnly(
+            self.viewer, {'action': 'search', 'title': 'calculus', 'keywords': 'highlighting', 'sort_by': '-rank'})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the search document is kept by a postgres trigger')
+class KeywordSearchTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='password')
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.client.force_login(self.buyer)
+
+    def search(self, **data):
+        response = sendAction(self.client, dict(data, action='search', format='json'))
+        return [post['id'] for post in response.json()['posts']]
+
+    def test_description_is_searched(self):
+        post = createPost(self.seller, title='Linear Algebra', description='Used for MATH 221, some highlighting')
+        createPost(self.seller, title='Linear Algebra', description='like new')
+        self.assertEqual(self.search(keywords='math 221', sort_by='-rank'), [post.pk])
+        # the document follows the post
+        post.description = 'like new'
+        post.save()
+        self.assertEqual(self.search(keywords='highlighted', sort_by='-rank'), [])
+
+    def test_title_ranks_first(self):
+        described = createPost(self.seller, title='Calculus', description='good companion to linear algebra')
+        titled = createPost(self.seller, title='Linear Algebra', description='good condition')
+        self.assertEqual(self.search(keywords='algebra', sort_by='-rank'), [titled.pk, described.pk])
+        # blended with the similarity of the title
+        self.assertEqual(self.search(title='calculus', keywords='algebra', sort_by='-rank'),
+                         [described.pk, titled.pk])
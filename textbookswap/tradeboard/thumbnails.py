@@ -0,0 +1,133 @@
+"""
+Makes the smaller copies of uploaded images that the pages actually show.
+
+Post, Message and Profile images are stored the way they were uploaded, which for a phone camera means several
+megabytes. Once the row holding a new image is committed, a worker process writes a copy of it for each of the
+sizes the row's images are shown at, in WebP and in JPEG (for browsers without WebP), with the EXIF data
+(GPS position included) left out. The copies are named after the original (see variantName), and when they are
+all written the original's name is recorded in the row's thumbnails_of field. Until then the templates keep
+showing the original image (see templatetags/thumbnails.py).
+
+The work happens in a process pool of THUMBNAIL_WORKERS processes, so uploads return right away. With
+THUMBNAIL_WORKERS = 0 the copies are made inline instead, which is what the tests use.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# longest side in pixels of every size images are copied at
+SIZES = {'card': 400, 'chat': 640, 'full': 1600}
+# file extension and PIL format of every copy
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+QUALITY = 80
+VARIANTS_DIR = 'variants'
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(settings.THUMBNAIL_WORKERS)
+    return _executor
+
+
+def variantName(name, size, ext):
+    """name in the storage of the copy of the image called name at a size and in a format"""
+    stem, _ = os.path.splitext(name)
+    return f'{VARIANTS_DIR}/{stem}.{size}.{ext}'
+
+
+def ready(instance):
+    """whether the copies of instance.image have been made"""
+    return bool(instance.image.name) and instance.image.name == instance.thumbnails_of
+
+
+def variantUrl(instance, size, ext):
+    """url of a copy of instance.image, or of the image itself while its copies haven't been made"""
+    if ready(instance):
+        return default_storage.url(variantName(instance.image.name, size, ext))
+    return instance.image.url
+
+
+def makeVariants(source, variants):
+    """runs in a worker process, writes every (longest side, PIL format, path) of variants from the image at source"""
+    with Image.open(source) as original:
+        # phones store the orientation in the EXIF data, which isn't carried over to the copies
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no transparency, put the image on a white background
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+        for side, format, path in variants:
+            copy = image.copy()
+            copy.thumbnail((side, side))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under another name first so that a half written copy is never served, and so that two
+            # workers copying the same default image don't write into the same file
+            partial = f'{path}.{os.getpid()}.part'
+            copy.save(partial, format, quality=QUALITY)
+            os.replace(partial, path)
+
+
+def schedule(instance, sizes, done=None):
+    """
+    has copies of instance.image made at sizes once the current transaction commits, unless they already exist.
+    done is called without arguments once they are recorded.
+    """
+    name = instance.image.name
+    if not name or ready(instance):
+        return
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: submit(model, pk, name, sizes, done))
+
+
+def submit(model, pk, name, sizes, done):
+    variants = [(SIZES[size], format, default_storage.path(variantName(name, size, ext)))
+                for size in sizes for ext, format in FORMATS.items()]
+    # the default images are shared by every row that has no image of its own, their copies are made once
+    variants = [variant for variant in variants if not os.path.exists(variant[2])]
+    source = default_storage.path(name)
+    if variants and settings.THUMBNAIL_WORKERS:
+        future = executor().submit(makeVariants, source, variants)
+        future.add_done_callback(lambda future: finished(future, model, pk, name, done))
+        return
+    if variants:
+        makeVariants(source, variants)
+    record(model, pk, name, done)
+
+
+def finished(future, model, pk, name, done):
+    """runs on the pool's own thread once a worker is done"""
+    if future.exception() is not None:
+        # the pages keep showing the original image
+        logger.error('could not make the copies of %s', name, exc_info=future.exception())
+        return
+    try:
+        record(model, pk, name, done)
+    finally:
+        connection.close()
+
+
+def record(model, pk, name, done):
+    # the image may have been replaced while its copies were being made, their own job records those
+    if model.objects.filter(pk=pk, image=name).update(thumbnails_of=name) and done is not None:
+        done()
+
+
+def deleteVariants(name):
+    """deletes every copy of the image called name"""
+    for size in SIZES:
+        for ext in FORMATS:
+            default_storage.delete(variantName(name, size, ext))
@@ -0,0 +1,134 @@
+"""
+Suggests titles and authors for the search inputs while the user types.
+
+Every process keeps the distinct titles and authors of the open posts in memory, each field in a list sorted by
+its folded form (see search.fold), so the values starting with what was typed are the range bisect finds in it.
+A suggestion never queries the database: the index is read from the database once, the first time a process
+suggests anything, and after that Post.save and the Post delete receiver change it for the one post that changed,
+once the change is committed. Unlike the version stamps (see stamps.py), which every process shares, the index
+belongs to the process that keeps it.
+
+A field holds at most MAX_VALUES distinct values. Once it is full, values no open post had before are left out
+until the next rebuild(), which keeps the ones most posts share.
+"""
+import bisect
+import collections
+import heapq
+import threading
+
+from django.db import transaction
+
+from .search import fold, open_posts
+
+MAX_VALUES = 20000
+# suggestions sent back for what was typed
+SUGGESTIONS = 8
+# values looked at for the most common ones, starting with the first in alphabetical order, so that a single letter
+# costs no more than a longer prefix
+MAX_SCAN = 1000
+FIELDS = ('title', 'author')
+
+
+class PrefixIndex:
+    """the distinct values of a field over the open posts, and how many open posts have each of them"""
+
+    def __init__(self, limit=MAX_VALUES):
+        self.limit = limit
+        self.keys = []
+        # the value as first written, and the number of open posts having it, by folded value
+        self.values = {}
+        self.counts = {}
+
+    def add(self, value):
+        """counts one more post having value, returns its folded form or None when the index had no room for it"""
+        key = fold(value)
+        if not key:
+            return None
+        if key in self.counts:
+            self.counts[key] += 1
+            return key
+        if len(self.keys) >= self.limit:
+            return None
+        bisect.insort(self.keys, key)
+        self.values[key] = value
+        self.counts[key] = 1
+        return key
+
+    def remove(self, key):
+        """counts one less post having the folded value key"""
+        if self.counts[key] > 1:
+            self.counts[key] -= 1
+            return
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        del self.values[key]
+        del self.counts[key]
+
+    def suggest(self, prefix, limit=SUGGESTIONS):
+        """the values starting with prefix that most open posts have"""
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        # nothing starting with prefix sorts after prefix followed by the last code point
+        end = min(bisect.bisect_left(self.keys, prefix + '\U0010ffff', start), start + MAX_SCAN)
+        best = heapq.nsmallest(limit, self.keys[start:end], key=lambda key: (-self.counts[key], key))
+        return [self.values[key] for key in best]
+
+
+class Typeahead:
+    def __init__(self, rows=()):
+        self.lock = threading.Lock()
+        self.fields = {field: PrefixIndex() for field in FIELDS}
+        # the folded values every open post was counted under, by post id
+        self.posts = {}
+        rows = list(rows)
+        # the values most posts share go in first, in case a field fills up
+        for field in FIELDS:
+            shared = collections.Counter(fold(row[field]) for row in rows)
+            rows.sort(key=lambda row: -shared[fold(row[field])])
+            for row in rows:
+                self.posts.setdefault(row['pk'], {})[field] = self.fields[field].add(row[field])
+
+    def update(self, pk, values):
+        """the open post pk now has values for each of FIELDS, or None for a post that was sold or deleted"""
+        with self.lock:
+            for field, key in self.posts.pop(pk, {}).items():
+                if key is not None:
+                    self.fields[field].remove(key)
+            if values is not None:
+                self.posts[pk] = {field: self.fields[field].add(values[field]) for field in FIELDS}
+
+    def suggest(self, field, prefix):
+        with self.lock:
+            return self.fields[field].suggest(prefix)
+
+
+_typeahead = None
+
+
+def rebuild():
+    """reads the titles and authors of every open post again"""
+    global _typeahead
+    _typeahead = Typeahead(open_posts().values('pk', 'title', 'author').iterator())
+    return _typeahead
+
+
+def typeahead():
+    index = _typeahead
+    return index if index is not None else rebuild()
+
+
+def suggest(field, prefix):
+    """up to SUGGESTIONS values of field (one of FIELDS) starting with prefix, the ones most open posts share first"""
+    return typeahead().suggest(field, prefix)
+
+
+def postChanged(post):
+    """called by Post.save, puts the post's title and author in the index once the save is committed"""
+    pk = post.pk
+    values = {field: getattr(post, field) for field in FIELDS} if post.transaction_state == post.IN_PROGRESS else None
+    transaction.on_commit(lambda: _typeahead is not None and _typeahead.update(pk, values))
+
+
+def postDeleted(pk):
+    transaction.on_commit(lambda: _typeahead is not None and _typeahead.update(pk, None))
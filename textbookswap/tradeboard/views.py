@@ -1,194 +1,286 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from django.db import models
 from django.db.models import BooleanField, Case, Value, When
-from django.db.models.expressions import OuterRef, Subquery
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
 from django.views.generic import DetailView
 
+from . import bookmarks, cards, instrumentation, messaging, negotiation, queries, representations, search, typeahead
+from .conditional import conditional, inboxETag, postsETag, threadETag, threadLastModified
+from .events import broker
 from .forms import BookSearchForm, BookSellForm, MessagingForm
-from .models import Post, Bookmark, MessageThread, Message
+from .models import Post, MessageThread, Message, Inbox
+from .pagination import MESSAGE_PAGE_SIZE, InvalidCursor, paginate
 
 
 import json
-import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
 def home(request):
     """function based view for homepage"""
-    user = request.user
     search_form = BookSearchForm()
-    if request.method == "POST":
-        if request.is_ajax():
-            return handleAJAXrequest(request)
     return render(request, 'tradeboard/home.html', {'search_form': search_form})
 
 
-def handleAJAXrequest(request):
-    """sends ajax requests to the proper function"""
-    commandToFunction = {
-        "load-tradeboard-tab": "",
-        "load-selling-list-tab": "",
-        "load-bookmark-tab": "",
-        "bookmark-post": "",
-        "delete-post": "",
-        "edit-post": "",
-        "sell-post": "",
-        "create-new-post": "",
-        "initialize": "",
-        "initialize": "",
-        "initialize": "",
-    }
-    if request.POST.get("action") == "bookmark":
-        return bookmark(request)
-    elif request.POST.get("action") == "initialize":
-        return initialize(request)
-    elif request.POST.get("action") == "clear":
-        return clear(request)
-    elif request.POST.get("action") == "loadTradeboard":
-        return initialize(request)
-    elif request.POST.get("action") == "loadBookmarks":
-        return loadBookmark(request)
-    elif request.POST.get("action") == "loadSellList":
-        return loadSellList(request)
-    elif request.POST.get("action") == "delete":
-        return deletePost(request)
-    elif request.POST.get("action") == "tag-sold":
-        return tagPostSold(request)
-    elif request.POST.get("action") == "get-new-post-form":
-        return getNewPostForm(request)
-    elif request.POST.get("action") == "get-edit-post-form":
-        return getEditPostForm(request)
-    elif request.POST.get("action") == "load-buyers-tab":
-        return loadBuyersTab(request)
-    elif request.POST.get("action") == "load-sellers-tab":
-        return loadSellersTab(request)
-    elif request.POST.get("action") == "load-message-thread":
-        return loadMessageThread(request)
-    elif request.POST.get("action") == "send-message":
-        return sendMessage(request)
-    elif request.POST.get("action") == "retract-offer":
-        return retractOffer(request)
-    elif request.POST.get("action") == "respond-to-offer":
-        return respondToOffer(request)
-    elif request.POST.get("action") == "reload-message-thread":
-        return reloadMessageThread(request)
-    else:
-        return handleForm(request)
+@login_required
+def action(request, name):
+    """answers the AJAX action called name at /actions/<name>/, actions that only read are GET requests"""
+    try:
+        view, methods = ACTIONS[name]
+    except KeyError:
+        raise Http404(f"no action called {name}")
+    if request.method not in methods:
+        return HttpResponseNotAllowed(methods)
+    instrumentation.name(request, name)
+    return view(request)
+
+
+def wantsJSON(request):
+    """whether the client asked for the JSON representation of an action (see representations.py) instead of html"""
+    return request.GET.get("format") == "json"
 
 
+@conditional(threadETag, threadLastModified)
 def reloadMessageThread(request):
+    """sends back only the messages of a thread that were sent or changed since the revision the client last saw"""
+    user = request.user
+    messageThread = get_object_or_404(
+        queries.chat_thread(MessageThread.objects), pk=request.GET.get("id"))
+    if(messageThread.buyer == user or messageThread.post.seller == user):
+        try:
+            since = int(request.GET.get("since"))
+        except (TypeError, ValueError):
+            return HttpResponse("invalid revision", status=400)
+        if messageThread.revision <= since:
+            # nothing happened in the thread, answer from the thread row alone
+            return HttpResponse(status=204)
+        return messageChanges(request, messageThread, since)
+    else:
+        return HttpResponse(status=403)
+
+
+def messageChanges(request, messageThread, since):
+    """sends back the messages of a thread that were sent or changed after the revision since, oldest first"""
+    messages = queries.thread_messages(
+        messageThread.messages.filter(revision__gt=since)).order_by('time_sent', 'id')
+    if wantsJSON(request):
+        return JsonResponse({'revision': messageThread.revision,
+                             'messages': [representations.message(message) for message in messages]})
+    changes = [{'id': message.id, 'html': render_to_string('tradeboard/components/message.html',
+                                                           {'message': message}, request)} for message in messages]
+    return HttpResponse(json.dumps({'revision': messageThread.revision, 'messages': changes}), content_type="application/json")
+
+
+def clientRevision(request, default):
+    """the revision of the thread the client had before changing it, so it gets every change it hasn't seen"""
+    try:
+        return int(request.POST.get("since"))
+    except (TypeError, ValueError):
+        return default
+
+
+def archiveMessageThread(request):
+    """hides a thread from the messaging panel of the user asking for it"""
+    user = request.user
+    messageThread = get_object_or_404(
+        queries.chat_thread(MessageThread.objects), pk=request.POST.get("id"))
+    if(messageThread.buyer == user or messageThread.post.seller == user):
+        messageThread.archive(user)
+        if wantsJSON(request):
+            return JsonResponse({'id': messageThread.pk, 'archived': True})
+        return HttpResponse("thread archived")
+    else:
+        return HttpResponse(status=403)
+
+
+def markThreadSeen(request):
+    """marks the messages the other side of a thread sent as seen by the user asking"""
     user = request.user
-    messageThread = MessageThread.objects.get(pk=request.POST.get("id"))
+    messageThread = get_object_or_404(
+        queries.chat_thread(MessageThread.objects), pk=request.POST.get("id"))
     if(messageThread.buyer == user or messageThread.post.seller == user):
-        html = ""
-        date_time_obj = datetime.datetime.strptime(
-            request.POST.get("since"), '%Y-%m-%d %H:%M:%S.%f %Z%z')
-        print(messageThread.messages.filter(
-            time_sent__gt=date_time_obj).count())
-        if(date_time_obj < messageThread.last_updated):
-            messages = messageThread.messages.all().order_by('-time_sent')
-            print("latestMessageTime", messageThread.last_updated)
-            html = render_to_string('tradeboard/components/message_thread_scroll.html',
-                                    {'messages': messages, 'messageThread': messageThread}, request)
-        return HttpResponse(html)
+        seen = messageThread.markSeen(user)
+        return JsonResponse({'id': messageThread.pk, 'seen': seen})
     else:
-        HttpResponse(status=403)
+        return HttpResponse(status=403)
+
+
+def inbox(request):
+    """the number of messages the user hasn't seen yet, for the badge of the messaging panel"""
+    unread = Inbox.objects.filter(user=request.user).values_list(
+        'unread_messages', flat=True).first()
+    return JsonResponse({'unread_messages': unread or 0})
+
+
+@login_required
+def pollEvents(request):
+    """long polling fallback for the message event stream, returns as soon as the user has events after ?since="""
+    since = request.GET.get("since")
+    if since is None:
+        return JsonResponse({'seq': broker.current(), 'events': []})
+    try:
+        since = int(since)
+    except ValueError:
+        return HttpResponse("invalid sequence number", status=400)
+    # waiting for events is what this view is for
+    instrumentation.exempt(request)
+    events = broker.wait(request.user.pk, since)
+    return JsonResponse({'seq': events[-1]['seq'] if events else since, 'events': events})
+
+
+def chatScreen(request, messageThread):
+    """renders and returns the chat screen of a thread with its latest page of messages, older ones are loaded by scrolling up"""
+    messages, next_cursor = paginate(queries.thread_messages(
+        messageThread.messages.all()), key='time_sent', page_size=MESSAGE_PAGE_SIZE)
+    if wantsJSON(request):
+        return JsonResponse(dict(representations.thread(messageThread, messages), cursor=next_cursor))
+    message_form = MessagingForm()
+    latestMessageTime = messageThread.last_updated
+    html = render_to_string('tradeboard/components/message_chat_screen.html',
+                            {'messages': messages, 'messageThread': messageThread, 'message_form': message_form, 'latestMessageTime': latestMessageTime, 'cursor': next_cursor}, request)
+    return HttpResponse(html)
+
+
+@conditional(threadETag, threadLastModified)
+def loadOlderMessages(request):
+    """sends back the page of a thread's messages that comes before the cursor"""
+    user = request.user
+    messageThread = get_object_or_404(
+        MessageThread.objects.select_related('post'), pk=request.GET.get("id"))
+    if(messageThread.buyer_id != user.pk and (messageThread.post is None or messageThread.post.seller_id != user.pk)):
+        return HttpResponse(status=403)
+    try:
+        page, next_cursor = paginate(queries.thread_messages(messageThread.messages.all()),
+                                     request.GET.get('cursor'), 'time_sent', MESSAGE_PAGE_SIZE)
+    except InvalidCursor:
+        return HttpResponse("invalid cursor", status=400)
+    if wantsJSON(request):
+        return JsonResponse({'messages': [representations.message(message) for message in page], 'cursor': next_cursor})
+    html = render_to_string('tradeboard/components/message_page.html',
+                            {'messages': page}, request)
+    return HttpResponse(json.dumps({'messages': html, 'cursor': next_cursor}), content_type="application/json")
 
 
 def respondToOffer(request):
-    print("respond to offer called")
     user = request.user
-    msg = Message.objects.get(id=request.POST.get("id"))
+    msg = get_object_or_404(
+        queries.offer_message(Message.objects), id=request.POST.get("id"))
     messageThread = msg.messageThread
-    if(user != msg.sender and (user == messageThread.post.seller or user == messageThread.buyer) and not msg.offer_retracted):
-        print("condition passed")
-        print(msg.offer_accepted)
-        msg.offer_accepted = True if request.POST.get(
-            "response") == "true" else False
-        msg.save()
-        messages = messageThread.messages.all().order_by('-time_sent')
-        message_form = MessagingForm()
-        html = render_to_string('tradeboard/components/message_chat_screen.html',
-                                {'messages': messages, 'messageThread': messageThread, 'message_form': message_form}, request)
-        return HttpResponse(html)
+    if(user != msg.sender and (user == messageThread.post.seller or user == messageThread.buyer)):
+        logger.debug("answering offer %s", msg.id)
+        since = clientRevision(request, messageThread.revision)
+        answer = negotiation.accept if request.POST.get(
+            "response") == "true" else negotiation.refuse
+        try:
+            answer(msg, user)
+        except negotiation.InvalidTransition:
+            return HttpResponse("the offer has already been answered", status=409)
+        return messageChanges(request, messageThread, since)
+    else:
+        return HttpResponse(status=403)
 
 
 def retractOffer(request):
     user = request.user
-    msg = Message.objects.get(id=request.POST.get("id"))
+    msg = get_object_or_404(
+        queries.offer_message(Message.objects), id=request.POST.get("id"))
     if(user == msg.sender and msg.offer):
-        msg.offer_retracted = True
-        msg.save()
-        messageThread = msg.messageThread
-        messages = messageThread.messages.all().order_by('-time_sent')
-        message_form = MessagingForm()
-        html = render_to_string('tradeboard/components/message_chat_screen.html',
-                                {'messages': messages, 'messageThread': messageThread, 'message_form': message_form}, request)
-        return HttpResponse(html)
+        since = clientRevision(request, msg.messageThread.revision)
+        try:
+            negotiation.retract(msg, user)
+        except negotiation.InvalidTransition:
+            return HttpResponse("the offer has already been answered", status=409)
+        return messageChanges(request, msg.messageThread, since)
+    else:
+        return HttpResponse(status=403)
 
 
 def sendMessage(request):
     user = request.user
-    messageThread = MessageThread.objects.get(
-        pk=request.POST.get("messageThread"))
-    messages = messageThread.messages.all().order_by('-time_sent')
+    messageThread = get_object_or_404(
+        queries.chat_thread(MessageThread.objects), pk=request.POST.get("messageThread"))
     if(messageThread.buyer == user or messageThread.post.seller == user):
         message_form_recieved = MessagingForm(request.POST, request.FILES)
-        print("is the message valid?", message_form_recieved.is_valid())
         if message_form_recieved.is_valid():
             message = message_form_recieved.save(commit=False)
             message.sender = user
             message.messageThread = messageThread
-            if(message.offer):
-                message.retractPreviousOffers()
-            message.save()
-            message_form = MessagingForm()
-            html = render_to_string('tradeboard/components/message_chat_screen.html',
-                                    {'messages': messages, 'messageThread': messageThread, 'message_form': message_form}, request)
-            return HttpResponse(html)
+            since = clientRevision(request, messageThread.revision)
+            messaging.append(message)
+            return messageChanges(request, messageThread, since)
+        logger.info("message to thread %s rejected: %s",
+                    messageThread.pk, message_form_recieved.errors.as_json())
+        if wantsJSON(request):
+            return JsonResponse(representations.form(message_form_recieved), status=400)
+        return HttpResponse("invalid message", status=400)
+    else:
+        return HttpResponse(status=403)
 
 
+@conditional(inboxETag)
 def loadBuyersTab(request):
     user = request.user
-    posts = user.posts.annotate(messageThreads_count=models.Count(
-        'messageThreads')).filter(messageThreads_count__gt=0)
+    posts = user.posts.filter(thread_count__gt=0)
+    posts = queries.buyers_tab(posts)
+    best = negotiation.bestOpenOffers(user)
+    for post in posts:
+        post.best_offer = best.get(post.pk)
+    if wantsJSON(request):
+        return JsonResponse({'posts': [{
+            'id': post.pk, 'title': post.title, 'author': post.author, 'edition': post.edition,
+            'transaction_state': post.transaction_state, 'best_offer': post.best_offer,
+            'messageThreads': [representations.thread_tile(messageThread) for messageThread in post.messageThreads.all()],
+        } for post in posts]})
     html = render_to_string('tradeboard/components/message_tab_buyers.html',
                             {'context': posts}, request)
     return HttpResponse(html)
 
 
+@conditional(inboxETag)
 def loadSellersTab(request):
     user = request.user
-    messageThreads = user.messageThreads.all()
+    messageThreads = queries.sellers_tab(
+        user.messageThreads.filter(archived_by_buyer=False))
+    if wantsJSON(request):
+        return JsonResponse({'messageThreads': [representations.thread_tile(messageThread)
+                                                for messageThread in messageThreads]})
     html = render_to_string('tradeboard/components/message_tab_sellers.html',
                             {'context': messageThreads}, request)
     return HttpResponse(html)
 
 
+def sellerDashboard(request):
+    """the figures of every post of the seller asking, for the seller dashboard, as JSON only"""
+    listings = queries.seller_dashboard(Post.objects.filter(seller=request.user))
+    return JsonResponse({'listings': [representations.listing(listing) for listing in listings]})
+
+
+@conditional(threadETag, threadLastModified)
 def loadMessageThread(request):
     user = request.user
-    messageThread = MessageThread.objects.get(pk=request.POST.get("id"))
-    messages = messageThread.messages.all().order_by('-time_sent')
-    if(messageThread.buyer == user or messageThread.post.seller == user):
-        message_form = MessagingForm()
-        latestMessageTime = messageThread.last_updated
-        html = render_to_string('tradeboard/components/message_chat_screen.html',
-                                {'messages': messages, 'messageThread': messageThread, 'message_form': message_form, 'latestMessageTime': latestMessageTime}, request)
-        return HttpResponse(html)
+    messageThread = get_object_or_404(
+        queries.chat_thread(MessageThread.objects), pk=request.GET.get("id"))
+    if(messageThread.buyer == user or (messageThread.post is not None and messageThread.post.seller == user)):
+        return chatScreen(request, messageThread)
     else:
-        HttpResponse(status=403)
+        return HttpResponse(status=403)
 
 
 def getNewPostForm(request):
     """renders and returns an html form for creating new posts"""
-    print('getNewPostForm function called')
     post_form = BookSellForm()
+    if wantsJSON(request):
+        return JsonResponse(representations.form(post_form))
     html = render_to_string('tradeboard/new_post.html',
                             {'post_form': post_form, 'action': 'new-post'}, request)
     return HttpResponse(html)
@@ -196,35 +288,31 @@ def getNewPostForm(request):
 
 def getEditPostForm(request):
     """renders and returns an editing form for editing existing posts"""
-    post = Post.objects.get(pk=request.POST['post'])
+    post = get_object_or_404(Post, pk=request.GET.get('post'))
     post_form = BookSellForm(instance=post)
+    if wantsJSON(request):
+        return JsonResponse(representations.form(post_form))
     html = render_to_string('tradeboard/new_post.html',
                             {'post_form': post_form, 'action': 'edit', 'post': post}, request)
     return HttpResponse(html)
 
 
-def handleForm(request):
-    """sends information from incoming forms to the proper function to respond to them"""
-    if 'description' in request.POST:
-        if request.POST['action'] == 'edit':
-            return editPost(request)
-        elif request.POST.get('action') == 'new-post':
-            return createNewPost(request)
-    else:
-        return filterPosts(request)
-
-
 def createNewPost(request):
     """accepts information from an incoming post creation form and either updates the database or returns an error"""
     user = request.user
     post_form = BookSellForm(request.POST, request.FILES)
     validity = post_form.is_valid()
-    print("is the form valid?", validity)
+    if not validity:
+        logger.info("new post rejected: %s", post_form.errors.as_json())
     if validity:
         post = post_form.save(commit=False)
         post.seller = user
         post.save()
+        if wantsJSON(request):
+            return JsonResponse(representations.post(post), status=201)
         return HttpResponse("post was successful")
+    elif wantsJSON(request):
+        return JsonResponse(representations.form(post_form), status=400)
     else:
         form = render_to_string(
             'tradeboard/new_post.html', {'post_form': post_form, 'action': 'new-post'}, request)
@@ -233,148 +321,212 @@ def createNewPost(request):
 
 def editPost(request):
     """accepts information from an incoming post editing form and either updates the database or returns an error"""
-    id = request.POST['post']
+    id = request.POST.get('post')
     user = request.user
-    post = Post.objects.get(id=id)
+    post = get_object_or_404(Post, id=id)
     if user == post.seller:
         post_form = BookSellForm(request.POST, request.FILES, instance=post)
         valid = post_form.is_valid()
         if valid:
             post_form.save()
+            if wantsJSON(request):
+                return JsonResponse(representations.post(post))
             return HttpResponse("post was successful")
+        elif wantsJSON(request):
+            return JsonResponse(representations.form(post_form), status=400)
         else:
             form = render_to_string(
-                'tradeboard/new_post.html', {'post_form': post_form}, request)
+                'tradeboard/new_post.html', {'post_form': post_form, 'action': 'edit', 'post': post}, request)
             return HttpResponse(form, status=400)
+    else:
+        raise PermissionDenied
 
 
 def deletePost(request):
     """accepts a request with the id of a post and either deletes it or returns an error"""
     id = request.POST.get('post')
-    post = Post.objects.get(id=id)
+    post = get_object_or_404(Post, id=id)
     if request.user == post.seller:
         post.delete()
+        if wantsJSON(request):
+            return JsonResponse({'id': int(id), 'deleted': True})
         return HttpResponse("Post deleted succesfully")
     else:
         raise PermissionDenied
-        return HttpResponse("You Don't have access to this post instance", status=400)
 
 
 def tagPostSold(request):
     """accepts a request with the id of a post and either tags it as 'complete' in the database or returns an error"""
     id = request.POST.get('post')
-    post = Post.objects.get(id=id)
+    post = get_object_or_404(Post, id=id)
     if request.user == post.seller:
         post.transaction_state = "Complete"
         post.save()
+        if wantsJSON(request):
+            return JsonResponse({'id': post.pk, 'transaction_state': post.transaction_state})
         return HttpResponse("Transaction completed succesfully")
     else:
         raise PermissionDenied
-        return HttpResponse("You Don't have access to this post instance", status=400)
 
 
+@conditional(postsETag)
 def loadBookmark(request):
     """renders and returns an html with all bookmarked posts"""
     user = request.user
-    posts = user.bookmarked_post.all()
-    bookmarks = Bookmark.objects.filter(user=request.user, post__id=OuterRef('id'))[
-        :1].values('user__id')
-    posts = posts.annotate(bookmarked=Subquery(bookmarks))
+    posts = Post.objects.filter(bookmark__user=user).annotate(
+        date_bookmarked=models.F('bookmark__date_bookmarked'))
     if_empty = {
         'small': 'Posts that you have bookmarked will show up in this tab',
         'main': "It seems that you don't have anything bookmarked at the moment."
     }
-    print("bookmarks: ====> ", posts)
-    posts = posts.order_by('-bookmark__date_bookmarked')
-    html = render_to_string('tradeboard/postpopulate.html',
-                            {'posts': posts, 'tab': 'Bookmark', 'if_empty': if_empty}, request)
-    return HttpResponse(html)
+    return renderPostPage(request, posts, 'Bookmark', if_empty, key='date_bookmarked')
 
 
+@conditional(postsETag)
 def loadSellList(request):
     """renders and returns an html with all posts being sold by the current user"""
     posts = Post.objects.filter(
         seller=request.user, transaction_state='In progress')
-    bookmarks = Bookmark.objects.filter(user=request.user, post__id=OuterRef('id'))[
-        :1].values('user__id')
-    posts = posts.annotate(bookmarked=Subquery(bookmarks))
-    posts = posts.order_by('-date_posted')
     if_empty = {
         'main': "Hi there! It looks like you haven't put up anything for sale yet.",
         'small': 'Click on \'Sell A Book\' above and fill out the form to to put up a book for sell'
     }
+    return renderPostPage(request, posts, 'SellList', if_empty)
+
+
+def renderPostPage(request, posts, tab, if_empty, key='date_posted'):
+    """renders a single page of posts for a tab and returns it with the cursor the client should send to get the next page"""
+    cursor = request.GET.get('cursor')
+    try:
+        page, next_cursor = paginate(queries.post_cards(posts), cursor, key)
+    except InvalidCursor:
+        return HttpResponse("invalid cursor", status=400)
+    bookmarked = bookmarks.bookmarked_ids(request.user)
+    if wantsJSON(request):
+        return JsonResponse({'posts': [representations.post(post, bookmarked) for post in page], 'cursor': next_cursor})
+    page = cards.render_cards(page, tab, bookmarked)
+    # only the first page should tell the user that the tab is empty
+    if cursor:
+        if_empty = None
     html = render_to_string('tradeboard/postpopulate.html',
-                            {'posts': posts.order_by('-date_posted'), 'tab': 'SellList', 'if_empty': if_empty}, request)
-    return HttpResponse(html)
+                            {'cards': page, 'if_empty': if_empty}, request)
+    return HttpResponse(json.dumps({'posts': html, 'cursor': next_cursor}), content_type="application/json")
 
 
 def clear(request):
     """clears search filters and returns a new empty search form"""
     search_form = BookSearchForm()
+    if wantsJSON(request):
+        return JsonResponse(representations.form(search_form))
     form = render_to_string(
         'tradeboard/searchForm.html', {'search_form': search_form}, request)
     return HttpResponse(form)
 
 
+@conditional(postsETag)
 def filterPosts(request):
     """accepts a search form through the request and returns posts that match the data from the search form"""
-    search_form = BookSearchForm(request.POST)
+    search_form = BookSearchForm(request.GET)
     if search_form.is_valid():
-        posts = search_form.filter().exclude(seller=request.user)
-        bookmarks = Bookmark.objects.filter(user=request.user, post__id=OuterRef('id'))[
-            :1].values('user__id')
-        posts = posts.annotate(bookmarked=Subquery(bookmarks))
-        bookmarked = []
-        if hasattr(request.user, 'bookmark'):
-            bookmarked = request.user.bookmark.posts.all()
+        posts = search.results(search_form, request.user)
+        facets = search.facets(search_form, request.user)
+        bookmarked = bookmarks.bookmarked_ids(request.user)
+        if wantsJSON(request):
+            return JsonResponse({'posts': [representations.post(post, bookmarked) for post in posts],
+                                 'facets': facets})
+        posts = cards.render_cards(posts, 'Tradeboard', bookmarked)
         if_empty = {
             'main': "Sorry! It seems we don't have anybooks that match your search",
             'small': 'Try slightly tweaking or removing some filters to see that works better'
         }
         html = render_to_string('tradeboard/postpopulate.html',
-                                {'posts': posts, 'bookmarked': bookmarked, 'tab': 'Tradeboard', 'if_empty': if_empty}, request)
+                                {'cards': posts, 'if_empty': if_empty}, request)
         form = render_to_string(
-            'tradeboard/searchForm.html', {'search_form': search_form}, request)
+            'tradeboard/searchForm.html', {'search_form': search_form, 'facets': facets}, request)
         return HttpResponse(json.dumps({'searchResults': html, 'form': form}), content_type="application/json")
+    elif wantsJSON(request):
+        return JsonResponse(representations.form(search_form), status=400)
     else:
         form = render_to_string(
             'tradeboard/searchForm.html', {'search_form': search_form}, request)
         return HttpResponse(form, status=400)
 
 
+def suggest(request):
+    """titles or authors of open posts starting with what the user typed in a search input, as JSON only"""
+    field = request.GET.get('field')
+    if field not in typeahead.FIELDS:
+        return HttpResponse("field must be title or author", status=400)
+    prefix = request.GET.get('q', '')[:BookSearchForm.base_fields[field].max_length]
+    response = JsonResponse({'field': field, 'suggestions': typeahead.suggest(field, prefix)})
+    # the same letters typed again within a minute are answered by the browser
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+
+@conditional(postsETag)
 def initialize(request):
-    """returns the tradeboard in it's default state"""
+    """returns the first page of the tradeboard in it's default state"""
     posts = Post.objects.exclude(seller=request.user)
-    # Got the Idea for the Subquery from https://stackoverflow.com/questions/38471260/django-filtering-by-user-id-in-class-based-listview
     posts = posts.filter(transaction_state='In progress')
-    bookmarks = Bookmark.objects.filter(user=request.user, post__id=OuterRef('id'))[
-        :1].values('user__id')
-    posts = posts.annotate(bookmarked=Subquery(bookmarks))
 
     if_empty = {
         'main': "Sorry! It seems that there are no books being sold here at the moment.",
         'small': 'Come back a different time and maybe you\'ll have better luck'
     }
-    print(posts.order_by('-date_posted').values('title'))
-    html = render_to_string('tradeboard/postpopulate.html',
-                            {'posts': posts.order_by('-date_posted').distinct(), 'tab': 'Tradeboard', 'if_empty': if_empty}, request)
-    return HttpResponse(html)
+    return renderPostPage(request, posts, 'Tradeboard', if_empty)
 
 
 def bookmark(request):
-    """accepts the id of a post through the request and and bookmark it"""
-    user = request.user
+    """accepts the id of a post through the request and bookmarks it, or removes the bookmark if it was already bookmarked"""
     pk = request.POST.get("pk")
-    post = Post.objects.get(pk=pk)
-    if post.bookmarks.filter(bookmark__user=user).exists():
-        post.bookmarks.remove(user)
-        bookmarked = False
-    else:
-        post.bookmarks.add(user)
-        bookmarked = True
+    try:
+        bookmarked = bookmarks.toggle(request.user, int(pk))
+    except (TypeError, ValueError):
+        return HttpResponse("invalid post", status=400)
     return HttpResponse(json.dumps({'bookmarked': bookmarked, 'pk': pk}), content_type="application/json")
 
 
+READ = ("GET", "HEAD")
+WRITE = ("POST",)
+
+# every AJAX action, the view answering it and the methods it is requested with
+ACTIONS = {
+    "initialize": (initialize, READ),
+    "loadBookmarks": (loadBookmark, READ),
+    "loadSellList": (loadSellList, READ),
+    "search": (filterPosts, READ),
+    "clear": (clear, READ),
+    "suggest": (suggest, READ),
+    "get-new-post-form": (getNewPostForm, READ),
+    "get-edit-post-form": (getEditPostForm, READ),
+    "load-buyers-tab": (loadBuyersTab, READ),
+    "load-sellers-tab": (loadSellersTab, READ),
+    "seller-dashboard": (sellerDashboard, READ),
+    "load-message-thread": (loadMessageThread, READ),
+    "reload-message-thread": (reloadMessageThread, READ),
+    "load-older-messages": (loadOlderMessages, READ),
+    "inbox": (inbox, READ),
+    "bookmark": (bookmark, WRITE),
+    "new-post": (createNewPost, WRITE),
+    "edit": (editPost, WRITE),
+    "delete": (deletePost, WRITE),
+    "tag-sold": (tagPostSold, WRITE),
+    "send-message": (sendMessage, WRITE),
+    "respond-to-offer": (respondToOffer, WRITE),
+    "retract-offer": (retractOffer, WRITE),
+    "archive-message-thread": (archiveMessageThread, WRITE),
+    "mark-thread-seen": (markThreadSeen, WRITE),
+}
+
+
+def metrics(request):
+    """the request figures of this process in the Prometheus text format, for METRICS_ALLOWED_IPS and staff"""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(instrumentation.metrics.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 class ContactDetailView(DetailView):
     """Class based view for displaying contact information for a particular post"""
     model = Post
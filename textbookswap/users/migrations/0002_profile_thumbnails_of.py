@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='thumbnails_of',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.0.3 on 2026-10-17 04:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_profile_thumbnails_of'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='chain',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='receiver',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='sender',
+        ),
+        migrations.RemoveField(
+            model_name='messagechain',
+            name='buyer',
+        ),
+        migrations.RemoveField(
+            model_name='messagechain',
+            name='post',
+        ),
+        migrations.RemoveField(
+            model_name='messagechain',
+            name='seller',
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.DeleteModel(
+            name='Bookmark',
+        ),
+        migrations.DeleteModel(
+            name='Message',
+        ),
+        migrations.DeleteModel(
+            name='MessageChain',
+        ),
+    ]
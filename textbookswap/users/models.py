@@ -3,7 +3,8 @@ from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from PIL import Image
+from tradeboard import thumbnails
+from tradeboard.cards import bumpSeller
 
 
 class Profile(models.Model):
@@ -12,6 +13,8 @@ class Profile(models.Model):
         User, on_delete=models.CASCADE, related_name='profile')
     image = models.ImageField(
         default="default_profile.png", upload_to="profile_pics")  # saves image to a folder called ../media/profile_pics or references an image located at ../media/default_profile.png if left empty.
+    # name of the image the smaller copies were made from, see tradeboard/thumbnails.py
+    thumbnails_of = models.CharField(max_length=100, blank=True, editable=False)
 
     def __str__(self):  # similar to a 'tostring' method in java
         return f"{self.user.username} Profile"
@@ -23,13 +26,8 @@ class Profile(models.Model):
 
     def save(self, *args, **kwargs):
         super(Profile, self).save(*args, **kwargs)
-
-        img = Image.open(self.image.path)
-
-        if img.height > 300 or img.width > 300:
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
+        # the picture is shrunk in the background, the cards of the user's posts show it once it is
+        thumbnails.schedule(self, ('card',), lambda: bumpSeller(self.user_id))
 
 
 @receiver(models.signals.post_delete, sender=Profile)
@@ -39,6 +37,7 @@ def submission_delete(sender, instance, **kwargs):
     when corresponding `Profile` object is deleted.
     """
     if not (instance.image.path == settings.MEDIA_ROOT + "/default_profile.png"):
+        thumbnails.deleteVariants(instance.image.name)
         instance.image.delete(False)
     else:
         pass
@@ -1,8 +1,14 @@
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from tradeboard.cards import bumpSeller
 from .models import Profile
 
+# fields of a user that are shown on the cards of their posts
+CARD_FIELDS = {'first_name', 'last_name', 'username'}
+# fields of a user that are edited on the profile page along with the profile
+PROFILE_FIELDS = {'first_name', 'last_name', 'username', 'email'}
+
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -10,5 +16,13 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_profile(sender, instance, update_fields=None, **kwargs):
+    # saving only other fields, like last_login when logging in, doesn't concern the profile
+    if update_fields is not None and not PROFILE_FIELDS & update_fields:
+        return
+    instance.profile.save()
+
+@receiver(post_save, sender=User)
+def refresh_user_post_cards(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or CARD_FIELDS & update_fields:
+        bumpSeller(instance.pk)
@@ -39,14 +39,11 @@ def profile(request):
         'u_form': u_form,
         'p_form': p_form
     }
-    print("printing", p_form)
-
     return render(request, 'users/profile.html', context)
 
 
 def profile_update(request):
     if request.method == 'POST':
-        print('profile update called')
         u_form = UserUpdateForm(request.POST, instance=request.user)
         p_form = ProfileUpdateForm(request.POST,
                                    request.FILES,